@@ -0,0 +1,255 @@
+"""
+Benchmarks of the client's hot paths, against the in-process fake server.
+
+Run from the project root, without network access or a LimeSurvey install:
+
+    python -m benchmarks.run
+    python -m benchmarks.run --save baseline.json
+    python -m benchmarks.run --compare baseline.json
+
+Each benchmark is timed over a number of rounds, after a warm-up round, and
+reports latency percentiles per round. The allocations are the peak traced
+by tracemalloc in one extra round, including the fake server's. Peak RSS is
+of the whole process, which also includes the fake server, and only ever
+grows, so it shows the largest footprint up to and including each
+benchmark.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from limesurveyrc2api.fakeserver import FakeLimeSurvey
+from limesurveyrc2api.limesurvey import LimeSurvey
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of the values."""
+    ordered = sorted(values)
+    index = max(0, int(round(percent / 100.0 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def peak_rss_kb():
+    """Peak resident set size of the process, in KiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+# Benchmarks: each takes the server, an open client, and a temporary
+# directory for its files, does its setup, and returns the function to time,
+# and the number of items each round handles.
+
+def bench_call_overhead(server, api, temp_dir):
+    survey_id = server.add_survey(participants=1)
+    calls = 200
+
+    def run():
+        for _ in range(calls):
+            api.token.get_summary(survey_id, "token_count")
+    return run, calls
+
+
+def bench_list_participants_paged(server, api, temp_dir):
+    survey_id = server.add_survey(participants=5000)
+
+    def run():
+        for _ in api.token.iter_participants(survey_id, page_size=500):
+            pass
+    return run, 5000
+
+
+def bench_add_participants_bulk(server, api, temp_dir):
+    survey_id = server.add_survey(participants=1)
+    rows = [{"firstname": "First%d" % x, "lastname": "Last%d" % x,
+             "email": "bench%d@example.com" % x} for x in range(2000)]
+
+    def run():
+        api.token.add_participants_bulk(survey_id, rows, chunk_size=500)
+    return run, len(rows)
+
+
+def bench_properties_fanout_threads(server, api, temp_dir):
+    survey_id = server.add_survey(participants=200)
+
+    def lookup(token_id):
+        return api.token.get_participant_properties(survey_id, token_id)
+
+    def run():
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lookup, range(1, 201)))
+    return run, 200
+
+
+def bench_properties_fanout_batch(server, api, temp_dir):
+    survey_id = server.add_survey(participants=200)
+
+    def run():
+        with api.batch(size=100) as batch:
+            futures = [batch.token.get_participant_properties(survey_id, x)
+                       for x in range(1, 201)]
+        for future in futures:
+            future.result()
+    return run, 200
+
+
+def bench_export_responses(server, api, temp_dir):
+    survey_id = server.add_survey(responses=20000, answer_size=20)
+
+    def run():
+        api.survey.export_responses(survey_id, "csv")
+    return run, 20000
+
+
+def bench_export_responses_to(server, api, temp_dir):
+    survey_id = server.add_survey(responses=20000, answer_size=20)
+
+    def run():
+        api.survey.export_responses_to(BytesIO(), survey_id, "csv")
+    return run, 20000
+
+
+def bench_import_survey(server, api, temp_dir):
+    path = os.path.join(temp_dir, "survey.lss")
+    with open(path, "wb") as f:
+        f.write(b"<document>" + b"x" * (4 * 2 ** 20) + b"</document>")
+
+    def run():
+        survey_id = api.survey.import_survey(path)
+        api.survey.delete_survey(survey_id)
+    return run, 1
+
+
+BENCHMARKS = [
+    ("call_overhead", bench_call_overhead),
+    ("list_participants_paged", bench_list_participants_paged),
+    ("add_participants_bulk", bench_add_participants_bulk),
+    ("properties_fanout_threads", bench_properties_fanout_threads),
+    ("properties_fanout_batch", bench_properties_fanout_batch),
+    ("export_responses", bench_export_responses),
+    ("export_responses_to", bench_export_responses_to),
+    ("import_survey", bench_import_survey),
+]
+
+
+def measure(run, items, rounds):
+    """Time the rounds of a benchmark, and trace one for allocations."""
+    run()
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        run()
+        peak_alloc = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    median = percentile(times, 50)
+    return {
+        "p50_ms": median * 1000,
+        "p90_ms": percentile(times, 90) * 1000,
+        "p99_ms": percentile(times, 99) * 1000,
+        "items_per_s": items / median if median else 0.0,
+        "peak_alloc_kb": peak_alloc // 1024,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def run_benchmarks(names=None, rounds=10, latency=0.0):
+    """
+    Run the benchmarks, by default all of them.
+
+    Return
+    :return: dict of results by benchmark name.
+    """
+    results = {}
+    with FakeLimeSurvey(latency=latency, seed=0) as server, \
+            tempfile.TemporaryDirectory() as temp_dir:
+        for name, setup in BENCHMARKS:
+            if names and name not in names:
+                continue
+            with LimeSurvey(url=server.url,
+                            username=server.username) as api:
+                api.open(password=server.password)
+                run, items = setup(server, api, temp_dir)
+                results[name] = measure(run, items, rounds)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the results against a baseline, flagging regressions.
+
+    Return
+    :return: names of the benchmarks whose p50 latency regressed by more
+      than the threshold ratio.
+    """
+    regressions = []
+    print("%-28s %10s %10s %8s" % ("benchmark", "base p50", "p50", "change"))
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            print("%-28s %10s %10.2f %8s" % (
+                name, "-", result["p50_ms"], "new"))
+            continue
+        change = 0.0
+        if base["p50_ms"]:
+            change = result["p50_ms"] / base["p50_ms"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("%-28s %10.2f %10.2f %+7.1f%%%s" % (
+            name, base["p50_ms"], result["p50_ms"], change * 100, flag))
+    return regressions
+
+
+def report(results):
+    print("%-28s %9s %9s %9s %11s %10s %10s" % (
+        "benchmark", "p50 ms", "p90 ms", "p99 ms", "items/s", "alloc KiB",
+        "RSS KiB"))
+    for name, result in sorted(results.items()):
+        print("%-28s %9.2f %9.2f %9.2f %11.0f %10d %10d" % (
+            name, result["p50_ms"], result["p90_ms"], result["p99_ms"],
+            result["items_per_s"], result["peak_alloc_kb"],
+            result["peak_rss_kb"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("names", nargs="*", help="Benchmarks to run.")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds the fake server waits per request.")
+    parser.add_argument("--save", help="Save the results as a baseline.")
+    parser.add_argument("--compare", help="Baseline to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Ratio of slowdown that counts as a regression.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.names, args.rounds, args.latency)
+    report(results)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(),
+                       "results": results}, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        print()
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
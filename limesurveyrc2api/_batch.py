@@ -0,0 +1,123 @@
+from concurrent.futures import Future
+from limesurveyrc2api._survey import _Survey
+from limesurveyrc2api._token import _Token
+from limesurveyrc2api.cache import MISSING
+from limesurveyrc2api.metrics import error_status
+
+
+class _Batch(object):
+    """
+    Collects API calls and sends them to the server in JSON-RPC batches.
+
+    Provides the same survey and token methods as LimeSurvey, but each call
+    returns a concurrent.futures.Future. The futures are resolved on flush(),
+    with the same result checks (and errors) as the direct calls. Like the
+    direct calls, they are answered from the client's cache and mirrors
+    when they can be, and update them and tell its listeners when sent.
+    """
+
+    def __init__(self, api, size=100):
+        """
+        Parameters
+        :param api: Client to send the calls with.
+        :type api: LimeSurvey
+        :param size: Maximum number of calls per HTTP request.
+        :type size: Integer
+        """
+        if size < 1:
+            raise ValueError("Batch size must be at least 1.")
+        self.api = api
+        self.size = size
+        self.pending = []
+        self.survey = _Survey(self)
+        self.token = _Token(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.cancel()
+
+    @property
+    def session_key(self):
+        return self.api.session_key
+
+    @property
+    def username(self):
+        return self.api.username
+
+    def call(self, method, params, check):
+        """
+        Add a call to the batch.
+
+        Return
+        :return: concurrent.futures.Future for the checked result.
+        """
+        future = Future()
+        self.pending.append((method, params, check, future))
+        return future
+
+    def query(self, method, params):
+        """
+        Add a call to the batch, without checking the result.
+        """
+        return self.call(method=method, params=params, check=lambda x: x)
+
+    def flush(self):
+        """
+        Send the pending calls, and resolve their futures.
+        """
+        pending, self.pending = self.pending, []
+        for method, params, check, future in pending:
+            result = self.api._cached(method, params)
+            if result is not MISSING:
+                future.set_result(result)
+                continue
+            response = self.api._mirrored(method, params)
+            if response is not MISSING:
+                self.resolve(method, params, check, future, response)
+            else:
+                self.pending.append((method, params, check, future))
+
+        while self.pending:
+            chunk = self.pending[:self.size]
+            del self.pending[:self.size]
+            try:
+                results = self.api.query_batch(
+                    [(method, params) for method, params, _, _ in chunk])
+            except Exception as e:
+                for _, _, _, future in chunk:
+                    future.set_exception(e)
+                self.cancel()
+                raise
+            for (method, params, check, future), result in zip(
+                    chunk, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    self.resolve(method, params, check, future, result)
+
+    def resolve(self, method, params, check, future, response):
+        """
+        Check the response to a call, and resolve its future with the
+        result or the error.
+        """
+        try:
+            result = check(response)
+        except Exception as e:
+            self.api.call_metrics.record_error(method, error_status(e))
+            future.set_exception(e)
+            return
+        self.api._after_call(method, params, result)
+        future.set_result(result)
+
+    def cancel(self):
+        """
+        Discard the pending calls, and cancel their futures.
+        """
+        for _, _, _, future in self.pending:
+            future.cancel()
+        self.pending = []
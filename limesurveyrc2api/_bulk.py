@@ -0,0 +1,251 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+import requests
+from limesurveyrc2api.exceptions import LimeSurveyError
+
+
+def _is_too_large(error):
+    """True if the server rejected the request as too large (HTTP 413)."""
+    return error.args[1:3] == ("Not response.ok", 413)
+
+
+class _BulkAddResult(object):
+    """
+    Outcome of _SyncToken.add_participants_bulk, per input row.
+
+    `participants` has an entry for each input row, in order: the created
+    participant (with "tid" and "token"), or None if it was not created.
+    `errors` maps the index of each row that was not created to its error:
+    the "errors" the server returned for the row, or the exception raised
+    for the chunk it was sent in.
+    """
+
+    def __init__(self):
+        self.participants = []
+        self.errors = {}
+        self.chunk_sizes = []
+        self.elapsed = 0.0
+
+    def __len__(self):
+        return len(self.participants)
+
+
+class _BulkAdder(object):
+    """
+    Adds participants in chunks, adapting the chunk size as it goes.
+
+    After each chunk, the size is halved if the call took longer than
+    target_seconds or the payload was larger than max_bytes, and grown by
+    half if both were less than half of their limits.
+    """
+
+    def __init__(self, token, survey_id, create_token_key=True,
+                 chunk_size=500, min_chunk_size=10, max_chunk_size=5000,
+                 target_seconds=5.0, max_bytes=2 ** 21):
+        self.token = token
+        self.survey_id = survey_id
+        self.create_token_key = create_token_key
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self.result = _BulkAddResult()
+        self._lock = threading.Lock()
+
+    def run(self, participant_data, workers=1):
+        """
+        Add the participants, with up to `workers` chunks in flight.
+
+        Return
+        :return: _BulkAddResult
+        """
+        started = time.perf_counter()
+        rows = iter(participant_data)
+        start = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight = set()
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                with self._lock:
+                    self.result.participants.extend([None] * len(chunk))
+                in_flight.add(executor.submit(self.add_chunk, start, chunk))
+                start += len(chunk)
+                if len(in_flight) >= workers:
+                    done, in_flight = wait(
+                        in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+            for future in in_flight:
+                future.result()
+        self.result.elapsed = time.perf_counter() - started
+        return self.result
+
+    def add_chunk(self, start, chunk):
+        """
+        Add one chunk of participants, and record the outcome per row.
+
+        A chunk rejected as too large is split in half and retried.
+        """
+        started = time.perf_counter()
+        try:
+            created = self.token.add_participants(
+                survey_id=self.survey_id, participant_data=chunk,
+                create_token_key=self.create_token_key)
+        except LimeSurveyError as e:
+            if _is_too_large(e) and len(chunk) > 1:
+                self.resize(len(chunk) // 2)
+                half = len(chunk) // 2
+                self.add_chunk(start, chunk[:half])
+                self.add_chunk(start + half, chunk[half:])
+                return
+            self.fail_chunk(start, chunk, e)
+            return
+        except (requests.RequestException, AssertionError) as e:
+            self.fail_chunk(start, chunk, e)
+            return
+        seconds = time.perf_counter() - started
+        payload_bytes = self.token.api.last_request_bytes()
+        if type(created) is not list:
+            error = LimeSurveyError("add_participants", created.get("status"))
+            self.fail_chunk(start, chunk, error)
+            return
+
+        with self._lock:
+            self.result.chunk_sizes.append(len(chunk))
+            for index, participant in enumerate(created, start):
+                if "errors" in participant:
+                    self.result.errors[index] = participant["errors"]
+                else:
+                    self.result.participants[index] = participant
+        self.adapt(len(chunk), seconds, payload_bytes)
+
+    def fail_chunk(self, start, chunk, error):
+        with self._lock:
+            self.result.chunk_sizes.append(len(chunk))
+            for index in range(start, start + len(chunk)):
+                self.result.errors[index] = error
+
+    def adapt(self, size, seconds, payload_bytes):
+        if seconds > self.target_seconds or payload_bytes > self.max_bytes:
+            self.resize(size // 2)
+        elif (seconds < self.target_seconds / 2 and
+              payload_bytes < self.max_bytes / 2 and
+              size >= self.chunk_size):
+            self.resize(int(size * 1.5) + 1)
+
+    def resize(self, size):
+        with self._lock:
+            self.chunk_size = max(
+                self.min_chunk_size, min(self.max_chunk_size, size))
+
+
+class _BulkTokenResult(object):
+    """
+    Outcome of a bulk delete or invite, per token id.
+
+    `results` maps each token id (as a string) to the server's result for
+    it, e.g. "Deleted" or {"status": "OK", ...}. `errors` maps the token ids
+    of failed chunks to the exception raised for the chunk. `unsent` lists
+    the token ids the server left out of its results, e.g. invitations over
+    the server's email batch size, which can be sent again.
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.results = {}
+        self.errors = {}
+        self.unsent = []
+        self.succeeded = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    @property
+    def remaining(self):
+        return self.total - self.succeeded - self.failed - len(self.unsent)
+
+
+class _BulkTokenRunner(object):
+    """
+    Runs a call that takes a list of token ids, over chunks of the ids.
+    """
+
+    def __init__(self, call, is_success, chunk_size=500, workers=1,
+                 progress=None):
+        """
+        Parameters
+        :param call: Function taking a chunk of token ids, returning a dict
+          of results by token id.
+        :type call: Callable
+        :param is_success: Function telling if a token's result is a success.
+        :type is_success: Callable
+        :param chunk_size: Number of token ids per call.
+        :type chunk_size: Integer
+        :param workers: Number of calls to make concurrently.
+        :type workers: Integer
+        :param progress: Function called after each chunk, with the numbers
+          of tokens succeeded, failed and remaining so far.
+        :type progress: Callable
+        """
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be at least 1.")
+        self.call = call
+        self.is_success = is_success
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.progress = progress
+        self.result = None
+        self._lock = threading.Lock()
+
+    def run(self, token_ids):
+        """
+        Return
+        :return: _BulkTokenResult
+        """
+        started = time.perf_counter()
+        token_ids = list(token_ids)
+        self.result = _BulkTokenResult(len(token_ids))
+        chunks = [token_ids[i:i + self.chunk_size]
+                  for i in range(0, len(token_ids), self.chunk_size)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for future in [executor.submit(self.run_chunk, x)
+                           for x in chunks]:
+                future.result()
+        self.result.elapsed = time.perf_counter() - started
+        return self.result
+
+    def run_chunk(self, chunk):
+        try:
+            response = self.call(chunk)
+        except (LimeSurveyError, requests.RequestException,
+                AssertionError) as e:
+            with self._lock:
+                for token_id in chunk:
+                    self.result.errors[str(token_id)] = e
+                self.result.failed += len(chunk)
+            self.report()
+            return
+
+        with self._lock:
+            for token_id in chunk:
+                key = str(token_id)
+                if key not in response:
+                    self.result.unsent.append(token_id)
+                    continue
+                self.result.results[key] = response[key]
+                if self.is_success(response[key]):
+                    self.result.succeeded += 1
+                else:
+                    self.result.failed += 1
+        self.report()
+
+    def report(self):
+        if self.progress is not None:
+            with self._lock:
+                counts = (self.result.succeeded, self.result.failed,
+                          self.result.remaining)
+            self.progress(*counts)
@@ -0,0 +1,108 @@
+import json
+from base64 import b64decode
+
+
+def decode_json_export(export):
+    """
+    Decode and parse a base64 encoded JSON export of responses.
+
+    Return
+    :return: dict with a "responses" list.
+    """
+    return json.loads(b64decode(export).decode("utf-8-sig"))
+
+
+def iter_json_responses(export_data):
+    """
+    Iterate over the responses in a parsed JSON export.
+
+    Depending on the LimeSurvey version, each response is either a dict of
+    fields, or a dict with the response id as the only key and the fields
+    as the value. This yields the fields in either case.
+    """
+    for response in export_data.get("responses", []):
+        if len(response) == 1:
+            fields = next(iter(response.values()))
+            if type(fields) is dict:
+                response = fields
+        yield response
+
+
+def response_id(response):
+    """
+    Return the id of a response in a JSON export, as an integer.
+
+    The id field is named "id" with "code" headings, and e.g. "Response ID"
+    with "full" or "abbreviated" headings, but it always comes first.
+    """
+    if "id" in response:
+        return int(response["id"])
+    return int(next(iter(response.values())))
+
+
+def response_ids(export_data):
+    """
+    Return the sorted response ids in a parsed JSON export.
+    """
+    return sorted(response_id(x) for x in iter_json_responses(export_data))
+
+
+def partition_ids(ids, partition_size):
+    """
+    Split sorted ids into ranges with up to partition_size ids each.
+
+    Return
+    :return: list of (first id, last id) tuples.
+    """
+    return [(ids[i], ids[min(i + partition_size, len(ids)) - 1])
+            for i in range(0, len(ids), partition_size)]
+
+
+def split_csv_header(data):
+    """
+    Split CSV bytes after the header row, respecting quoted line breaks.
+
+    Return
+    :return: tuple of (header row including the line end, other rows).
+    """
+    quoted = False
+    for i, char in enumerate(data):
+        if char == 0x22:  # "
+            quoted = not quoted
+        elif char == 0x0a and not quoted:  # \n
+            return data[:i + 1], data[i + 1:]
+    return data, b""
+
+
+def merge_csv(parts):
+    """
+    Join decoded CSV exports into one, keeping only the first header row.
+    """
+    if not parts:
+        return b""
+    header, body = split_csv_header(parts[0])
+    line_end = b"\r\n" if header.endswith(b"\r\n") else b"\n"
+    merged = [header, body]
+    for part in parts[1:]:
+        body = split_csv_header(part)[1]
+        if not body:
+            continue
+        if merged[-1] and not merged[-1].endswith(b"\n"):
+            merged.append(line_end)
+        merged.append(body)
+    return b"".join(merged)
+
+
+def merge_json(parts):
+    """
+    Join decoded JSON exports into one, concatenating their responses.
+    """
+    merged = None
+    for part in parts:
+        data = json.loads(part.decode("utf-8-sig"))
+        if merged is None:
+            merged = data
+        else:
+            merged.setdefault("responses", []).extend(
+                data.get("responses", []))
+    return json.dumps(merged or {"responses": []}).encode("utf-8")
@@ -0,0 +1,310 @@
+import codecs
+import csv
+import io
+from base64 import b64decode
+from datetime import datetime
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+try:
+    import pandas
+except ImportError:  # pragma: no cover
+    pandas = None
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+# Question types with numeric answers: numerical input, multiple numerical
+# input, 5 point choice, array (numbers).
+NUMERIC_QUESTION_TYPES = {"N", "K", "5", ":"}
+DATE_QUESTION_TYPES = {"D"}
+META_COLUMN_TYPES = {
+    "id": "int",
+    "lastpage": "float",
+    "submitdate": "datetime",
+    "startdate": "datetime",
+    "datestamp": "datetime",
+}
+DATE_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
+if pyarrow is not None:
+    ARROW_TYPES = {
+        "str": pyarrow.string(), "int": pyarrow.int64(),
+        "float": pyarrow.float64(), "datetime": pyarrow.timestamp("s")}
+
+
+def column_types(header, questions):
+    """
+    Choose a column type for each column of a "code" heading export.
+
+    Parameters
+    :param header: Column names of the export.
+    :type header: List[String]
+    :param questions: Questions of the survey, from list_questions.
+    :type questions: List[Dict]
+
+    Return
+    :return: list of "int", "float", "datetime" or "str", per column.
+    """
+    question_types = {}
+    for question in questions:
+        if str(question.get("parent_qid", "0")) == "0":
+            question_types[question["title"]] = question["type"]
+    types = []
+    for name in header:
+        title, _, subquestion = name.partition("[")
+        question_type = question_types.get(title)
+        if name in META_COLUMN_TYPES:
+            types.append(META_COLUMN_TYPES[name])
+        elif subquestion.rstrip("]") in ("other", "comment"):
+            types.append("str")
+        elif question_type in NUMERIC_QUESTION_TYPES:
+            types.append("float")
+        elif question_type in DATE_QUESTION_TYPES:
+            types.append("datetime")
+        else:
+            types.append("str")
+    return types
+
+
+def parse_csv(export, delimiter=","):
+    """
+    Decode a base64 encoded CSV export, and parse it into columns.
+
+    Return
+    :return: tuple of (column names, list of column value lists)
+    """
+    text = b64decode(export).decode("utf-8-sig")
+    reader = csv.reader(io.StringIO(text, newline=""), delimiter=delimiter)
+    header = next(reader, [])
+    columns = [list(x) for x in zip(*reader)]
+    if not columns:
+        columns = [[] for _ in header]
+    return header, columns
+
+
+def read_frame(export, questions, kind="auto", delimiter=","):
+    """
+    Decode a base64 encoded CSV export into typed columns.
+
+    Each column gets a type from column_types. The CSV is parsed with
+    pandas.read_csv or pyarrow.csv when one of them builds the requested
+    kind of columns, and otherwise row by row with the csv module.
+
+    Parameters
+    :param export: Base64 encoded CSV export, with "code" headings.
+    :type export: String
+    :param questions: Questions of the survey, from list_questions.
+    :type questions: List[Dict]
+    :param kind: See build_frame.
+    :type kind: String
+    :param delimiter: Field separator of the CSV export.
+    :type delimiter: String
+    """
+    kind = _frame_kind(kind)
+    data = b64decode(export)
+    if data.startswith(codecs.BOM_UTF8):
+        data = data[len(codecs.BOM_UTF8):]
+    first_line = data.split(b"\n", 1)[0].decode("utf-8")
+    header = next(csv.reader([first_line], delimiter=delimiter), [])
+    types = column_types(header, questions)
+    if header and kind == "arrow":
+        try:
+            return _read_arrow(data, header, types, delimiter)
+        except pyarrow.ArrowInvalid:
+            pass  # e.g. text in a numeric column, which should become null.
+    if header and pandas is not None and kind != "python":
+        frame = _read_pandas(data, header, types, delimiter)
+        columns = [frame.iloc[:, i] for i in range(len(header))]
+        if kind == "pandas":
+            return frame
+        if kind == "arrow":
+            return pyarrow.table([
+                pyarrow.array(series, type=ARROW_TYPES[column_type])
+                for series, column_type in zip(columns, types)],
+                names=header)
+        return dict(zip(header, [
+            _pandas_to_numpy(series, column_type)
+            for series, column_type in zip(columns, types)]))
+    header, columns = parse_csv(export, delimiter=delimiter)
+    return build_frame(header, columns, types, kind=kind)
+
+
+def _read_pandas(data, header, types, delimiter):
+    # Numbers are left for pandas to infer, and only text in them, if any,
+    # is converted afterwards.
+    frame = pandas.read_csv(
+        io.BytesIO(data), sep=delimiter, header=None, skiprows=1,
+        names=list(range(len(header))), index_col=False,
+        dtype=dict((i, object) for i, column_type in enumerate(types)
+                   if column_type in ("str", "datetime")),
+        keep_default_na=False, na_values=[""], low_memory=False,
+        float_precision="round_trip")
+    columns = []
+    for i, column_type in enumerate(types):
+        series = frame[i]
+        if column_type == "str":
+            series = series.where(series.notna(), None)
+        elif column_type == "datetime":
+            series = _pandas_dates(series)
+        else:
+            series = pandas.to_numeric(series, errors="coerce")
+            series = series.astype(
+                "Int64" if column_type == "int" else "float64")
+        columns.append(series)
+    frame = pandas.concat(columns, axis=1)
+    frame.columns = header
+    return frame
+
+
+def _pandas_dates(series):
+    # Like _parse_date, each value gets the first format that matches it.
+    result = pandas.to_datetime(
+        series, format=DATE_FORMATS[0], errors="coerce")
+    for date_format in DATE_FORMATS[1:]:
+        missing = result.isna() & series.notna()
+        if not missing.any():
+            break
+        result[missing] = pandas.to_datetime(
+            series[missing], format=date_format, errors="coerce")
+    return result
+
+
+def _pandas_to_numpy(series, column_type):
+    if column_type == "str":
+        return series.to_numpy(dtype=object)
+    if column_type == "datetime":
+        return series.to_numpy(dtype="datetime64[s]")
+    if column_type == "int" and not series.isna().any():
+        return series.to_numpy(dtype="int64")
+    return series.to_numpy(dtype="float64", na_value=numpy.nan)
+
+
+def _read_arrow(data, header, types, delimiter):
+    names = ["f%d" % i for i in range(len(header))]
+    table = pyarrow.csv.read_csv(
+        io.BytesIO(data),
+        read_options=pyarrow.csv.ReadOptions(
+            column_names=names, skip_rows=1),
+        parse_options=pyarrow.csv.ParseOptions(
+            delimiter=delimiter, newlines_in_values=True),
+        convert_options=pyarrow.csv.ConvertOptions(
+            column_types=dict(
+                (name, ARROW_TYPES[column_type])
+                for name, column_type in zip(names, types)),
+            null_values=[""], strings_can_be_null=True,
+            timestamp_parsers=DATE_FORMATS))
+    return table.rename_columns(header)
+
+
+def _parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    return None
+
+
+def _to_python(values, column_type):
+    if column_type == "str":
+        return [x if x != "" else None for x in values]
+    if column_type == "datetime":
+        return [_parse_date(x) if x != "" else None for x in values]
+    convert = int if column_type == "int" else float
+    result = []
+    for value in values:
+        try:
+            result.append(convert(value))
+        except ValueError:
+            result.append(None)
+    return result
+
+
+def _to_numpy(values, column_type):
+    if column_type == "str":
+        return numpy.array(_to_python(values, "str"), dtype=object)
+    if column_type == "datetime":
+        return numpy.array(
+            [x or "NaT" for x in _to_python(values, "datetime")],
+            dtype="datetime64[s]")
+    converted = _to_python(values, column_type)
+    if column_type == "int" and None not in converted:
+        return numpy.array(converted, dtype="int64")
+    return numpy.array(
+        [numpy.nan if x is None else x for x in converted], dtype="float64")
+
+
+def _to_pandas(values, column_type):
+    series = pandas.Series(values, dtype=object)
+    if column_type == "str":
+        return series.where(series != "", None)
+    if column_type == "datetime":
+        return pandas.to_datetime(series, errors="coerce")
+    numbers = pandas.to_numeric(series, errors="coerce")
+    if column_type == "int":
+        return numbers.astype("Int64")
+    return numbers.astype("float64")
+
+
+def _to_arrow(values, column_type):
+    return pyarrow.array(
+        _to_python(values, column_type), type=ARROW_TYPES[column_type])
+
+
+def _frame_kind(kind):
+    """
+    Return the kind of columns to build, checking it is installed.
+    """
+    if kind == "auto":
+        kind = ("pandas" if pandas is not None else
+                "arrow" if pyarrow is not None else
+                "numpy" if numpy is not None else "python")
+    required = {"pandas": pandas, "arrow": pyarrow, "numpy": numpy}
+    if kind in required and required[kind] is None:
+        raise ImportError("Frame kind %s requires the %s package."
+                          % (kind, "pyarrow" if kind == "arrow" else kind))
+    if kind not in ("pandas", "arrow", "numpy", "python"):
+        raise ValueError("Unknown frame kind: %s" % kind)
+    return kind
+
+
+def build_frame(header, columns, types, kind="auto"):
+    """
+    Build typed columns in the requested form.
+
+    Parameters
+    :param kind: "pandas" for a DataFrame, "arrow" for a pyarrow Table,
+      "numpy" for a dict of arrays, "python" for a dict of lists, or
+      "auto" for the first of these that is installed.
+    :type kind: String
+    """
+    kind = _frame_kind(kind)
+    convert = {"pandas": _to_pandas, "arrow": _to_arrow,
+               "numpy": _to_numpy, "python": _to_python}[kind]
+    typed = [convert(values, column_type)
+             for values, column_type in zip(columns, types)]
+    if kind == "pandas":
+        frame = pandas.concat(typed, axis=1) if typed else pandas.DataFrame()
+        frame.columns = header
+        return frame
+    if kind == "arrow":
+        return pyarrow.table(typed, names=header)
+    return dict(zip(header, typed))
+
+
+def write_parquet(frame, path):
+    """
+    Write a pandas DataFrame or pyarrow Table to a Parquet file.
+    """
+    if pyarrow is None:
+        raise ImportError("Parquet output requires the pyarrow package.")
+    if pandas is not None and isinstance(frame, pandas.DataFrame):
+        frame = pyarrow.Table.from_pandas(frame, preserve_index=False)
+    elif isinstance(frame, dict):
+        frame = pyarrow.table(frame)
+    pyarrow.parquet.write_table(frame, path)
@@ -0,0 +1,100 @@
+import json
+from collections import OrderedDict
+from limesurveyrc2api.exceptions import LimeSurveyError
+
+# API methods that only read data, so calling them again, or sharing one
+# call's result between callers, has no side effects.
+READ_METHODS = frozenset([
+    "list_surveys", "list_groups", "list_questions", "export_responses",
+    "get_participant_properties", "get_summary", "list_participants",
+])
+
+
+def encode_request(method, params, request_id=1, codec=None):
+    """
+    Serialize an API call as a JSON-RPC request.
+
+    Parameters
+    :param method: Name of API method to call.
+    :type method: String
+    :param params: Parameters to the specified API call.
+    :type params: OrderedDict
+    :param request_id: JSON-RPC id of the request.
+    :type request_id: Integer
+    :param codec: (optional) Codec to encode the request to bytes with.
+    :type codec: limesurveyrc2api.codec.JsonCodec
+
+    Return
+    :return: JSON string, or bytes if a codec is given.
+    """
+    data = OrderedDict([
+        ("method", method),
+        ("params", params),
+        ("id", request_id)
+    ])
+    if codec is not None:
+        return codec.dumps(data)
+    return json.dumps(data)
+
+
+def check_http_response(method, status_code, content):
+    """
+    Raise an error if the http response can't contain an API result.
+
+    Parameters
+    :param method: Name of API method(s) called, for the error message.
+    :type method: String
+    :param status_code: HTTP status code of the response.
+    :type status_code: Integer
+    :param content: Body of the response.
+    :type content: Bytes
+
+    Return
+    :raise: LimeSurveyError if the response is an http error or empty.
+    """
+    if not status_code < 400:
+        raise LimeSurveyError(
+            method, "Not response.ok", status_code, content)
+
+    if not 0 < len(content):
+        raise LimeSurveyError(
+            method, "Not 0 < len(response.content)", status_code, content)
+
+
+def get_result(method, response_data, status_code, content):
+    """
+    Return the result from a parsed JSON-RPC response.
+
+    Parameters
+    :param method: Name of API method called, for the error message.
+    :type method: String
+    :param response_data: Parsed response body.
+    :type response_data: Dict
+    :param status_code: HTTP status code of the response.
+    :type status_code: Integer
+    :param content: Body of the response.
+    :type content: Bytes
+
+    Return
+    :return: result of API call
+    :raise: LimeSurveyError if the response has no result.
+    """
+    try:
+        return response_data["result"]
+    except (KeyError, TypeError):
+        raise LimeSurveyError(
+            method, "Key 'result' not in response json",
+            status_code, content)
+
+
+def is_invalid_session(result):
+    """
+    True if the result is the status for an invalid or expired session key.
+
+    The API words it differently between methods, e.g. "Invalid session
+    key", "Invalid Session Key", or "Invalid S ession key".
+    """
+    if type(result) is not dict or "status" not in result:
+        return False
+    status = str(result["status"]).lower().replace(" ", "")
+    return status == "invalidsessionkey"
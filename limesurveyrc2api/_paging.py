@@ -0,0 +1,148 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from limesurveyrc2api.exceptions import LimeSurveyError
+
+NO_PARTICIPANTS = "No survey participants found."
+
+
+def flatten_participant(participant):
+    """
+    Return a list_participants row with its participant_info (firstname,
+    lastname, email) moved up beside tid, token and the other attributes.
+    """
+    row = dict(participant)
+    row.update(row.pop("participant_info", None) or {})
+    return row
+
+
+class _ParticipantPager(object):
+    """
+    Iterates over the participants of a survey, one list_participants page
+    at a time, so only the current (and prefetched) page is held in memory.
+
+    After or during iteration, `pages` is the number of pages fetched and
+    `page_times` the seconds each page took to fetch.
+    """
+
+    def __init__(self, token, survey_id, page_size=1000, prefetch=False,
+                 **kwargs):
+        """
+        Parameters
+        :param token: Token methods of the client to page with.
+        :type token: _SyncToken
+        :param survey_id: ID of survey to list participants from.
+        :type survey_id: Integer
+        :param page_size: Number of participants to request per page.
+        :type page_size: Integer
+        :param prefetch: If True, fetch the next page in a background thread
+          while the current page is consumed.
+        :type prefetch: Bool
+        :param kwargs: Other arguments for list_participants.
+        """
+        if page_size < 1:
+            raise ValueError("Page size must be at least 1.")
+        self.token = token
+        self.survey_id = survey_id
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.kwargs = kwargs
+        self.pages = 0
+        self.page_times = []
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self):
+        """Total seconds spent fetching pages."""
+        return sum(self.page_times)
+
+    def fetch_page(self, start):
+        """
+        Fetch the page of participants starting at the start index.
+
+        Return
+        :return: list of participants, empty if there are no more.
+        """
+        started = time.perf_counter()
+        try:
+            page = self.token.list_participants(
+                survey_id=self.survey_id, start=start, limit=self.page_size,
+                **self.kwargs)
+        except LimeSurveyError as e:
+            if NO_PARTICIPANTS not in e.message:
+                raise
+            page = []
+        with self._lock:
+            self.page_times.append(time.perf_counter() - started)
+            self.pages += 1
+        return page
+
+    def __iter__(self):
+        if self.prefetch:
+            return self._iter_prefetch()
+        return self._iter()
+
+    def _iter(self):
+        start = 0
+        while True:
+            page = self.fetch_page(start)
+            for participant in page:
+                yield participant
+            if len(page) < self.page_size:
+                return
+            start += self.page_size
+
+    def _iter_prefetch(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            start = 0
+            future = executor.submit(self.fetch_page, start)
+            while future is not None:
+                page = future.result()
+                start += self.page_size
+                if len(page) < self.page_size:
+                    future = None
+                else:
+                    future = executor.submit(self.fetch_page, start)
+                for participant in page:
+                    yield participant
+                del page
+        finally:
+            executor.shutdown(wait=False)
+
+    def fetch_all(self, count, workers):
+        """
+        Fetch all pages, with up to `workers` pages requested at once.
+
+        The pages covering the first `count` participants are fetched
+        concurrently, then any further pages one by one until a short page,
+        in case participants were added meanwhile. Participants that moved
+        between pages while fetching are returned once, by their tid.
+
+        Parameters
+        :param count: Expected number of participants.
+        :type count: Integer
+        :param workers: Number of pages to fetch concurrently.
+        :type workers: Integer
+
+        Return
+        :return: list of participants, in order.
+        """
+        starts = range(0, max(count, 1), self.page_size)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pages = list(executor.map(self.fetch_page, starts))
+        start = starts[-1]
+        while len(pages[-1]) == self.page_size:
+            start += self.page_size
+            pages.append(self.fetch_page(start))
+
+        participants = []
+        seen = set()
+        for page in pages:
+            for participant in page:
+                tid = participant.get("tid")
+                if tid in seen:
+                    continue
+                seen.add(tid)
+                participants.append(participant)
+        return participants
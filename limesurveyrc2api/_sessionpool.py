@@ -0,0 +1,75 @@
+import queue
+from collections import OrderedDict
+from contextlib import contextmanager
+from limesurveyrc2api.exceptions import LimeSurveyError
+
+
+class _SessionPool(object):
+    """
+    A fixed set of LimeSurvey sessions for concurrent workers.
+
+    Each session is a client that shares the connections and settings of
+    the client that created the pool, with its own session key. A worker
+    borrows one with session(), and close() releases all the session keys.
+    """
+
+    def __init__(self, api, password, size=4):
+        """
+        Parameters
+        :param api: Client to base the sessions on.
+        :type api: LimeSurvey
+        :param password: LimeSurvey password to authenticate with.
+        :type password: String
+        :param size: Number of sessions to open.
+        :type size: Integer
+        """
+        if size < 1:
+            raise ValueError("Session pool size must be at least 1.")
+        self.clients = []
+        self.idle = queue.Queue()
+        try:
+            for _ in range(size):
+                client = api._clone()
+                client.open(password=password)
+                self.clients.append(client)
+                self.idle.put(client)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def session(self, timeout=None):
+        """
+        Borrow a session client, waiting for a free one if all are in use.
+
+        Parameters
+        :param timeout: Seconds to wait, or None to wait indefinitely.
+        :type timeout: Float
+        """
+        client = self.idle.get(timeout=timeout)
+        try:
+            yield client
+        finally:
+            self.idle.put(client)
+
+    def close(self):
+        """
+        Release the session keys of all the sessions.
+        """
+        for client in self.clients:
+            if not client.session_key:
+                continue
+            params = OrderedDict([("sSessionKey", client.session_key)])
+            try:
+                client.query(method="release_session_key", params=params)
+            except LimeSurveyError:
+                pass
+            client.session_key = None
+            client._password = None
+        self.clients = []
@@ -0,0 +1,52 @@
+import copy
+import threading
+from concurrent.futures import Future
+
+
+class _SingleFlight(object):
+    """
+    Coalesces identical concurrent calls into one.
+
+    The first caller for a key (the leader) makes the call; callers with the
+    same key that arrive while it is in flight wait for it, and get a copy
+    of its result, or its exception. `coalesced` counts those callers.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """
+        Call function, unless a call with the same key is in flight.
+
+        Parameters
+        :param key: Identifies calls that have the same result.
+        :type key: Hashable
+        :param function: Makes the call, taking no arguments.
+        :type function: Callable
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return copy.deepcopy(future.result())
+
+        try:
+            result = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
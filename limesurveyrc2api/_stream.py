@@ -0,0 +1,158 @@
+import codecs
+import json
+import re
+from base64 import b64decode
+from itertools import chain
+from limesurveyrc2api.exceptions import LimeSurveyError
+from limesurveyrc2api._jsonrpc import get_result
+
+RESULT_KEY = re.compile(br'"result"\s*:\s*')
+WHITESPACE = re.compile(r'[\s,]*')
+ITEM_END = re.compile(r'[\s,\]]')
+
+
+def write_base64_result(method, chunks, fileobj, status_code=200):
+    """
+    Decode the base64 string result of a JSON-RPC response into a file.
+
+    The response body is read chunk by chunk, and the base64 text of the
+    result is decoded and written as it arrives, so memory use depends on
+    the chunk size and not on the size of the result.
+
+    If the result is not a string (e.g. an error status dict), nothing is
+    written and the parsed result is returned instead.
+
+    Parameters
+    :param method: Name of API method called, for error messages.
+    :type method: String
+    :param chunks: Response body, as an iterable of bytes.
+    :type chunks: Iterable[Bytes]
+    :param fileobj: Binary file to write the decoded result to.
+    :type fileobj: File
+    :param status_code: HTTP status code of the response.
+    :type status_code: Integer
+
+    Return
+    :return: tuple of (number of bytes written, non-string result or None)
+    :raise: LimeSurveyError if the response has no result or it is truncated.
+    """
+    chunks = iter(chunks)
+    head = b""
+    match = None
+    for chunk in chunks:
+        head += chunk
+        match = RESULT_KEY.search(head)
+        if match is not None and match.end() < len(head):
+            break
+    else:
+        match = None
+
+    if match is None or not head[match.end():].startswith(b'"'):
+        # Not a string result, so it's small enough to parse as usual.
+        content = head + b"".join(chunks)
+        try:
+            response_data = json.loads(content.decode("utf-8-sig"))
+        except ValueError:
+            response_data = None
+        return 0, get_result(method, response_data, status_code, content)
+
+    written = 0
+    pending = b""
+    for data in chain([head[match.end() + 1:]], chunks):
+        end = data.find(b'"')
+        if end != -1:
+            data = data[:end]
+        # PHP escapes "/" as "\/", and backslashes are not base64.
+        pending += data.replace(b"\\", b"")
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            decoded = b64decode(pending[:usable])
+            fileobj.write(decoded)
+            written += len(decoded)
+            pending = pending[usable:]
+        if end != -1:
+            break
+    else:
+        raise LimeSurveyError(
+            method, "Response ended inside the result string", status_code)
+
+    if pending:
+        raise LimeSurveyError(
+            method, "Result is not valid base64", status_code)
+    return written, None
+
+
+def iter_result_items(method, chunks, status_code=200):
+    """
+    Parse the array result of a JSON-RPC response, item by item.
+
+    The response body is read chunk by chunk, and each item of the result
+    array is parsed and yielded as soon as it has arrived, so memory use and
+    the time to the first item don't depend on the size of the result.
+
+    If the result is not an array (e.g. an error status dict), it is parsed
+    as usual and returned instead.
+
+    Parameters
+    :param method: Name of API method called, for error messages.
+    :type method: String
+    :param chunks: Response body, as an iterable of bytes.
+    :type chunks: Iterable[Bytes]
+    :param status_code: HTTP status code of the response.
+    :type status_code: Integer
+
+    Return
+    :return: tuple of (iterator of the items or None, non-array result or
+      None)
+    :raise: LimeSurveyError if the response has no result or it is truncated.
+    """
+    chunks = iter(chunks)
+    head = b""
+    match = None
+    for chunk in chunks:
+        head += chunk
+        match = RESULT_KEY.search(head)
+        if match is not None and match.end() < len(head):
+            break
+    else:
+        match = None
+
+    if match is None or not head[match.end():].startswith(b"["):
+        content = head + b"".join(chunks)
+        try:
+            response_data = json.loads(content.decode("utf-8-sig"))
+        except ValueError:
+            response_data = None
+        return None, get_result(method, response_data, status_code, content)
+
+    return _iter_items(
+        method, head[match.end() + 1:], chunks, status_code), None
+
+
+def _iter_items(method, rest, chunks, status_code):
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    text = utf8.decode(rest)
+    position = 0
+    while True:
+        position = WHITESPACE.match(text, position).end()
+        if text.startswith("]", position):
+            return
+        try:
+            item, end = decoder.raw_decode(text, position)
+        except ValueError:
+            end = None
+        # An item is only complete once the delimiter after it has arrived,
+        # as a number cut off by the end of a chunk, e.g. "4." of "4.5",
+        # would still parse.
+        if end is not None and ITEM_END.match(text, end):
+            yield item
+            position = end
+            continue
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise LimeSurveyError(
+                method, "Response ended inside the result array",
+                status_code)
+        text = text[position:] + utf8.decode(chunk)
+        position = 0
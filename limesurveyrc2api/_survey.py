@@ -1,13 +1,38 @@
+import json
+import os
 import warnings
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from collections import OrderedDict
+from limesurveyrc2api._wrapper import _Wrapper, check_response
+from limesurveyrc2api._stream import write_base64_result
+from limesurveyrc2api._export import (
+    decode_json_export, iter_json_responses, response_id, response_ids,
+    partition_ids, merge_csv, merge_json)
+from limesurveyrc2api._frame import read_frame, write_parquet
 from limesurveyrc2api.exceptions import LimeSurveyError
 from os.path import splitext
-from base64 import b64encode
+from base64 import b64encode, b64decode
 
-class _Survey(object):
+EXPORT_RESPONSES_ERRORS = [
+    "Language code not found for this survey.",
+    "No Data, could not get max id.",
+    "No Data, survey table does not exist",
+    "No permission",
+    "Invalid session key"
+]
 
-    def __init__(self, api):
-        self.api = api
+LIST_QUESTIONS_ERRORS = [
+    "Error: Invalid survey ID",
+    "Error: Invalid language",
+    "Error: IMissmatch in surveyid and groupid",
+    "No questions found",
+    "No permission",
+    "Invalid session key"
+]
+
+
+class _Survey(_Wrapper):
 
     def list_surveys(self, username=None):
         """
@@ -22,22 +47,12 @@ class _Survey(object):
             ("sSessionKey", self.api.session_key),
             ("iSurveyID", username or self.api.username)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Invalid user",
-                "No surveys found",
-                "Invalid session key"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is list
-        return response
+        error_messages = [
+            "Invalid user",
+            "No surveys found",
+            "Invalid session key"
+        ]
+        return self._call(method, params, error_messages, list)
 
     def list_questions(self, survey_id,
                        group_id=None, language=None):
@@ -53,31 +68,16 @@ class _Survey(object):
         :type language: String
         """
         method = "list_questions"
-        params = OrderedDict([
+        params = self._list_questions_params(survey_id, group_id, language)
+        return self._call(method, params, LIST_QUESTIONS_ERRORS, list)
+
+    def _list_questions_params(self, survey_id, group_id, language):
+        return OrderedDict([
             ("sSessionKey", self.api.session_key),
             ("iSurveyID", survey_id),
             ("iGroupID", group_id),
             ("sLanguage", language)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Error: Invalid survey ID",
-                "Error: Invalid language",
-                "Error: IMissmatch in surveyid and groupid",
-                "No questions found",
-                "No permission",
-                "Invalid session key"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is list
-        return response
 
     def delete_survey(self, survey_id):
         """ Delete a survey.
@@ -91,21 +91,11 @@ class _Survey(object):
             ("sSessionKey", self.api.session_key),
             ("iSurveyID", survey_id)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "No permission",
-                "Invalid session key"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is list
-        return response
+        error_messages = [
+            "No permission",
+            "Invalid session key"
+        ]
+        return self._call(method, params, error_messages, list)
 
     def export_responses(self, survey_id, document_type, language_code=None,
                          completion_status='all', heading_type='code',
@@ -135,7 +125,17 @@ class _Survey(object):
         :type fields: Array
         """
         method = "export_responses"
-        params = OrderedDict([
+        params = self._export_responses_params(
+            survey_id, document_type, language_code, completion_status,
+            heading_type, response_type, from_response_id, to_response_id,
+            fields)
+        return self._call(method, params, EXPORT_RESPONSES_ERRORS, str)
+
+    def _export_responses_params(
+            self, survey_id, document_type, language_code, completion_status,
+            heading_type, response_type, from_response_id, to_response_id,
+            fields):
+        return OrderedDict([
             ("sSessionKey", self.api.session_key),
             ("iSurveyID", survey_id),
             ("sDocumentType", document_type),
@@ -147,24 +147,6 @@ class _Survey(object):
             ("iToResponseID", to_response_id),
             ("aFields", fields)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Language code not found for this survey.",
-                "No Data, could not get max id.",
-                "No Data, survey table does not exist",
-                "No permission",
-                "Invalid session key"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is str
-        return response
 
     def import_survey(self, path_to_import_survey, new_name=None,
                       dest_survey_id=None):
@@ -201,23 +183,14 @@ class _Survey(object):
             ("sNewSurveyName", new_name),
             ("DestSurveyID", dest_survey_id)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Error: ...",  # TODO: Unclear what might be returned here
-                "Invalid extension",
-                "No permission",
-                "Invalid session key"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is int  # the new survey id
-        return response
+        error_messages = [
+            "Error: ...",  # TODO: Unclear what might be returned here
+            "Invalid extension",
+            "No permission",
+            "Invalid session key"
+        ]
+        # the new survey id
+        return self._call(method, params, error_messages, int)
 
     def activate_survey(self, survey_id):
         """ Activate an existing survey.
@@ -231,23 +204,13 @@ class _Survey(object):
             ("sSessionKey", self.api.session_key),
             ("iSurveyID", survey_id)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Error: Invalid survey ID",
-                "Error: ...",  # TODO: what could be output of ActivateResults?
-                "No permission",
-                "Invalid session key"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is list
-        return response
+        error_messages = [
+            "Error: Invalid survey ID",
+            "Error: ...",  # TODO: what could be output of ActivateResults?
+            "No permission",
+            "Invalid session key"
+        ]
+        return self._call(method, params, error_messages, list)
 
     def activate_tokens(self, survey_id, attribute_fields=[]):
         """
@@ -266,23 +229,13 @@ class _Survey(object):
             ("iSurveyId", survey_id),
             ("aAttributeFields", attribute_fields)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Error: Invalid survey ID",
-                "Survey participants table could not be created",
-                "No permission",
-                "Invalid session key"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is list
-        return response
+        error_messages = [
+            "Error: Invalid survey ID",
+            "Survey participants table could not be created",
+            "No permission",
+            "Invalid session key"
+        ]
+        return self._call(method, params, error_messages, list)
 
     def list_groups(self, survey_id):
         """ Return the ids and all attributes of groups belonging to survey.
@@ -296,20 +249,240 @@ class _Survey(object):
             ("sSessionKey", self.api.session_key),
             ("iSurveyID", survey_id)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Error: Invalid survey ID",
-                "No groups found",
-                "No permission"
-                "Invalid S ession key"  # typo in remotecontrol_handle.php
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is list
-        return response
+        error_messages = [
+            "Error: Invalid survey ID",
+            "No groups found",
+            "No permission"
+            "Invalid S ession key"  # typo in remotecontrol_handle.php
+        ]
+        return self._call(method, params, error_messages, list)
+
+
+class _SyncSurvey(_Survey):
+    """
+    Survey methods, with helpers built on them that need the blocking
+    LimeSurvey client, e.g. for streamed and parallel exports.
+    """
+
+    def stream_questions(self, survey_id, group_id=None, language=None,
+                         chunk_size=65536):
+        """
+        Yield questions from the specified survey, as they are read from the
+        response.
+
+        Like list_questions, but the response is parsed incrementally, so the
+        first questions are available before the rest have arrived. Only
+        available with the blocking LimeSurvey client.
+
+        Parameters
+        :param chunk_size: Bytes to read from the response at a time.
+        :type chunk_size: Integer
+
+        See list_questions for the other parameters.
+
+        Return
+        :return: iterator of questions.
+        :raise: LimeSurveyError, when iteration starts, for error statuses.
+        """
+        method = "list_questions"
+        params = self._list_questions_params(survey_id, group_id, language)
+        return self._stream_items(
+            method, params, LIST_QUESTIONS_ERRORS, chunk_size)
+
+    def export_responses_to(
+            self, path_or_file, survey_id, document_type, language_code=None,
+            completion_status='all', heading_type='code',
+            response_type='short', from_response_id=None,
+            to_response_id=None, fields=None, chunk_size=65536):
+        """ Export responses, decoded, into a file.
+
+        Unlike export_responses, the response body is streamed and decoded
+        chunk by chunk, so the export is never held in memory as a whole.
+        Only available with the blocking LimeSurvey client.
+
+        Parameters
+        :param path_or_file: Path of the file to write, or a binary file
+          object to write to.
+        :type path_or_file: String or File
+        :param chunk_size: Bytes to read from the response at a time.
+        :type chunk_size: Integer
+
+        See export_responses for the other parameters.
+
+        Return
+        :return: number of bytes written.
+        """
+        method = "export_responses"
+        params = self._export_responses_params(
+            survey_id, document_type, language_code, completion_status,
+            heading_type, response_type, from_response_id, to_response_id,
+            fields)
+        if hasattr(path_or_file, "write"):
+            return self._stream_export(method, params, path_or_file,
+                                       chunk_size)
+        try:
+            with open(path_or_file, "wb") as f:
+                return self._stream_export(method, params, f, chunk_size)
+        except BaseException:
+            if os.path.exists(path_or_file):
+                os.remove(path_or_file)
+            raise
+
+    def _stream_export(self, method, params, fileobj, chunk_size):
+        def parse(method, chunks, status_code):
+            return write_base64_result(method, chunks, fileobj, status_code)
+
+        response, written, result = self.api.read_stream(
+            method, params, parse, chunk_size)
+        response.close()
+        if result is not None:
+            check_response(method, result, EXPORT_RESPONSES_ERRORS, str)
+        return written
+
+    def parallel_export_responses(
+            self, survey_id, document_type, workers=4, partition_size=1000,
+            language_code=None, completion_status='all', heading_type='code',
+            response_type='short', fields=None, retries=2):
+        """ Export responses in base64 encoded string, in parallel parts.
+
+        The response ids are listed first with a small JSON export of only
+        the id field. The ids are split into ranges of up to partition_size
+        responses, which are exported concurrently, then joined into one
+        export with a single header and in response id order. Each range is
+        retried up to `retries` times if its export fails.
+
+        Only "csv" and "json" exports can be joined. Only available with the
+        blocking LimeSurvey client, whose pool_maxsize should be at least
+        `workers`.
+
+        Parameters
+        :param workers: Number of ranges to export concurrently.
+        :type workers: Integer
+        :param partition_size: Maximum number of responses per range.
+        :type partition_size: Integer
+        :param retries: Number of retries for each range.
+        :type retries: Integer
+
+        See export_responses for the other parameters.
+        """
+        merge = {"csv": merge_csv, "json": merge_json}.get(document_type)
+        if merge is None:
+            raise ValueError(
+                "Parallel export supports csv and json, not %s."
+                % document_type)
+        id_export = self.export_responses(
+            survey_id, "json", language_code=language_code,
+            completion_status=completion_status, fields=["id"])
+        ids = response_ids(decode_json_export(id_export))
+        partitions = partition_ids(ids, partition_size)
+
+        def export_partition(partition):
+            for attempt in range(retries + 1):
+                try:
+                    return b64decode(self.export_responses(
+                        survey_id, document_type, language_code,
+                        completion_status, heading_type, response_type,
+                        partition[0], partition[1], fields))
+                except (LimeSurveyError, requests.RequestException) as e:
+                    if isinstance(e, LimeSurveyError) and \
+                            "No Data" in e.message:
+                        return b""  # Responses deleted since listing ids.
+                    if attempt == retries:
+                        raise
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(export_partition, partitions))
+        parts = [x for x in parts if x]
+        return b64encode(merge(parts)).decode("ascii")
+
+    def export_responses_incremental(
+            self, survey_id, state, dataset=None, refetch_window=0,
+            language_code=None, completion_status='all', heading_type='code',
+            response_type='short', fields=None):
+        """ Export the responses added since the last incremental export.
+
+        The highest exported response id is kept per survey in `state`, and
+        only responses after it are exported, as JSON. Optionally the last
+        `refetch_window` response ids are exported again, to pick up
+        responses that were completed since.
+
+        If `dataset` is given, the exported responses are appended to it as
+        JSON lines. Re-fetched responses are appended again, so when reading
+        the dataset a later line for a response id replaces earlier ones.
+
+        Parameters
+        :param survey_id: Id of the Survey.
+        :type survey_id: Integer
+        :param state: Where the highest exported response ids are kept.
+        :type state: limesurveyrc2api.incremental.ExportState
+        :param dataset: (optional) Path of a JSON lines file to append to.
+        :type dataset: String
+        :param refetch_window: (optional) Number of response ids before the
+          highest exported one to export again.
+        :type refetch_window: Integer
+
+        See export_responses for the other parameters.
+
+        Return
+        :return: list of the exported responses, as dicts of fields.
+        """
+        last_id = state.get(survey_id)
+        from_response_id = max(last_id + 1 - refetch_window, 1)
+        if fields is not None and "id" not in fields:
+            fields = ["id"] + list(fields)
+        try:
+            export = self.export_responses(
+                survey_id, "json", language_code, completion_status,
+                heading_type, response_type, from_response_id, None, fields)
+        except LimeSurveyError as e:
+            if "No Data" in e.message:
+                return []
+            raise
+        responses = list(iter_json_responses(decode_json_export(export)))
+        if not responses:
+            return responses
+
+        if dataset is not None:
+            with open(dataset, "a", encoding="utf-8") as f:
+                for response in responses:
+                    f.write(json.dumps(response) + "\n")
+        highest_id = max(response_id(x) for x in responses)
+        if highest_id > last_id:
+            state.set(survey_id, highest_id)
+        return responses
+
+    def export_responses_frame(
+            self, survey_id, kind="auto", parquet_path=None,
+            language_code=None, completion_status='all',
+            response_type='short', from_response_id=None,
+            to_response_id=None, fields=None, delimiter=","):
+        """ Export responses as typed columns, e.g. a pandas DataFrame.
+
+        The responses are exported as CSV with question code headings, and
+        each column gets a type from its question type in list_questions:
+        numeric questions become floats, date questions datetimes, and other
+        answers strings. Only available with the blocking LimeSurvey client.
+
+        Parameters
+        :param survey_id: Id of the Survey.
+        :type survey_id: Integer
+        :param kind: (optional) "pandas" for a DataFrame, "arrow" for a
+          pyarrow Table, "numpy" for a dict of arrays, "python" for a dict
+          of lists, or "auto" for the first one that is installed.
+        :type kind: String
+        :param parquet_path: (optional) Path to also write the columns to as
+          a Parquet file, which requires pyarrow.
+        :type parquet_path: String
+        :param delimiter: (optional) Field separator of the CSV export.
+        :type delimiter: String
+
+        See export_responses for the other parameters.
+        """
+        questions = self.list_questions(survey_id, language=language_code)
+        export = self.export_responses(
+            survey_id, "csv", language_code, completion_status, "code",
+            response_type, from_response_id, to_response_id, fields)
+        frame = read_frame(export, questions, kind=kind, delimiter=delimiter)
+        if parquet_path is not None:
+            write_parquet(frame, parquet_path)
+        return frame
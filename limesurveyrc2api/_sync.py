@@ -0,0 +1,88 @@
+import hashlib
+import json
+
+# Fields of list_participants rows that are not participant data.
+ID_FIELDS = {"tid", "token"}
+
+
+def _value(value):
+    return "" if value is None else str(value)
+
+
+def row_hash(row, fields):
+    """
+    Hash the values of the fields in a participant row, compared as strings.
+    """
+    values = [_value(row.get(x)) for x in fields]
+    return hashlib.sha1(json.dumps(values).encode("utf-8")).hexdigest()
+
+
+class _SyncReport(object):
+    """
+    Changes made (or, for a dry run, to be made) by sync_participants.
+
+    `to_add` lists the desired rows to add, `to_delete` the token ids to
+    delete, and `changed` the keys of participants that are replaced (so
+    they appear in both). `unchanged` counts the participants left as they
+    are, and `duplicates` lists desired rows skipped for a repeated key.
+    After a sync, `add_result` and `delete_result` hold the bulk results.
+    """
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.to_add = []
+        self.to_delete = []
+        self.changed = []
+        self.unchanged = 0
+        self.duplicates = []
+        self.add_result = None
+        self.delete_result = None
+
+
+def diff_participants(current, desired, key, dry_run=False):
+    """
+    Work out the adds and deletes that turn current into desired.
+
+    Participants are matched by the key field. A matched participant is
+    replaced if any field given in its desired row differs. Current
+    participants sharing a key with an earlier one are deleted.
+
+    Parameters
+    :param current: Current participants, flattened list_participants rows.
+    :type current: Iterable[Dict]
+    :param desired: Desired participant rows.
+    :type desired: Iterable[Dict]
+    :param key: Field that identifies a participant, e.g. "email".
+    :type key: String
+
+    Return
+    :return: _SyncReport
+    """
+    report = _SyncReport(dry_run)
+    wanted = {}
+    for row in desired:
+        row_key = _value(row.get(key))
+        if row_key in wanted:
+            report.duplicates.append(row)
+        else:
+            wanted[row_key] = row
+
+    seen = set()
+    for row in current:
+        row_key = _value(row.get(key))
+        desired_row = wanted.get(row_key)
+        if desired_row is None or row_key in seen:
+            report.to_delete.append(row["tid"])
+            continue
+        seen.add(row_key)
+        fields = sorted(x for x in desired_row if x not in ID_FIELDS)
+        if row_hash(row, fields) == row_hash(desired_row, fields):
+            report.unchanged += 1
+        else:
+            report.changed.append(row_key)
+            report.to_delete.append(row["tid"])
+            report.to_add.append(desired_row)
+
+    report.to_add.extend(
+        row for row_key, row in wanted.items() if row_key not in seen)
+    return report
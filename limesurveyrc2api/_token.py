@@ -1,11 +1,21 @@
 from collections import OrderedDict
-from limesurveyrc2api.exceptions import LimeSurveyError
+from limesurveyrc2api._wrapper import _Wrapper
+from limesurveyrc2api._paging import _ParticipantPager, flatten_participant
+from limesurveyrc2api._bulk import _BulkAdder, _BulkTokenRunner
+from limesurveyrc2api.mirror import ParticipantMirror
+from limesurveyrc2api._sync import ID_FIELDS, diff_participants
 
+LIST_PARTICIPANTS_ERRORS = [
+    "Error: Invalid survey ID",
+    "Error: No token table",
+    "No survey participants found.",
+    "Invalid session key",
+    "No permission",
+    "Invalid Session Key"
+]
 
-class _Token(object):
 
-    def __init__(self, api):
-        self.api = api
+class _Token(_Wrapper):
 
     def add_participants(
             self, survey_id, participant_data, create_token_key=True):
@@ -28,22 +38,12 @@ class _Token(object):
             ("aParticipantData", participant_data),
             ("bCreateToken", create_token_key)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Error: Invalid survey ID",
-                "No token table",
-                "No permission"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is list
-        return response
+        error_messages = [
+            "Error: Invalid survey ID",
+            "No token table",
+            "No permission"
+        ]
+        return self._call(method, params, error_messages, list)
 
     def delete_participants(self, survey_id, token_ids):
         """
@@ -61,23 +61,13 @@ class _Token(object):
             ("iSurveyID", survey_id),
             ("aTokenIDs", token_ids)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Error: Invalid survey ID",
-                "Error: No token table",
-                "No permission",
-                "Invalid Session Key"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is dict
-        return response
+        error_messages = [
+            "Error: Invalid survey ID",
+            "Error: No token table",
+            "No permission",
+            "Invalid Session Key"
+        ]
+        return self._call(method, params, error_messages, dict)
 
     def get_participant_properties(
             self, survey_id, token_id, token_query_properties=None,
@@ -119,27 +109,17 @@ class _Token(object):
             ("aTokenQueryProperties", token_query_properties),
             ("aTokenProperties", token_properties)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Error: Invalid survey ID",
-                "Error: No token table",
-                "Error: No results were found based on your attributes.",
-                "Error: More than 1 result was found based on your attributes.",
-                "Error: Invalid tokenid",
-                "No valid Data",
-                "No permission",
-                "Invalid Session Key"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is dict
-        return response
+        error_messages = [
+            "Error: Invalid survey ID",
+            "Error: No token table",
+            "Error: No results were found based on your attributes.",
+            "Error: More than 1 result was found based on your attributes.",
+            "Error: Invalid tokenid",
+            "No valid Data",
+            "No permission",
+            "Invalid Session Key"
+        ]
+        return self._call(method, params, error_messages, dict)
 
     def get_summary(self, survey_id, stat_name="all"):
         """
@@ -166,24 +146,14 @@ class _Token(object):
             ("iSurveyID", survey_id),
             ("sStatName", stat_name)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Invalid surveyid",
-                "Invalid summary key",
-                "No available data",
-                "No permission",
-                "Invalid session key"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is dict
-        return response
+        error_messages = [
+            "Invalid surveyid",
+            "Invalid summary key",
+            "No available data",
+            "No permission",
+            "Invalid session key"
+        ]
+        return self._call(method, params, error_messages, dict)
 
     def invite_participants(self, survey_id, token_ids, uninvited_only=True):
         """
@@ -205,24 +175,14 @@ class _Token(object):
             ("aTokenIDs", token_ids),
             ("bEmail", uninvited_only)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Invalid session key",
-                "Error: Invalid survey ID",
-                "Error: No token table",
-                "Error: No candidate tokens",
-                "No permission",
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is dict
-        return response
+        error_messages = [
+            "Invalid session key",
+            "Error: Invalid survey ID",
+            "Error: No token table",
+            "Error: No candidate tokens",
+            "No permission",
+        ]
+        return self._call(method, params, error_messages, dict)
 
     def list_participants(
             self, survey_id, start=0, limit=1000, ignore_token_used=False,
@@ -247,35 +207,23 @@ class _Token(object):
         :type conditions: List[Dict]
         """
         method = "list_participants"
-        conditions = conditions or []
-        params = OrderedDict([
+        params = self._list_participants_params(
+            survey_id, start, limit, ignore_token_used, attributes,
+            conditions)
+        return self._call(method, params, LIST_PARTICIPANTS_ERRORS, list)
+
+    def _list_participants_params(
+            self, survey_id, start, limit, ignore_token_used, attributes,
+            conditions):
+        return OrderedDict([
             ("sSessionKey", self.api.session_key),
             ("iSurveyID", survey_id),
             ("iStart", start),
             ("iLimit", limit),
             ("bUnused", ignore_token_used),
             ("aAttributes", attributes),
-            ("aConditions", conditions)
+            ("aConditions", conditions or [])
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Error: Invalid survey ID",
-                "Error: No token table",
-                "No survey participants found.",
-                "Invalid session key",
-                "No permission",
-                "Invalid Session Key"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is list
-        return response
 
     def remind_participants(self, survey_id, min_days_between=None,
                             max_reminders=None, token_ids=False):
@@ -301,21 +249,333 @@ class _Token(object):
             ("iMaxReminders", max_reminders),
             ("aTokenIds", token_ids)
         ])
-        response = self.api.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = [
-                "Error: No survey participants table",
-                "Error: No candidate tokens",
-                "Error: Invalid survey ID",
-                "No permission",
-                "Invalid Session Key"
-            ]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is list
-        return response
+        error_messages = [
+            "Error: No survey participants table",
+            "Error: No candidate tokens",
+            "Error: Invalid survey ID",
+            "No permission",
+            "Invalid Session Key"
+        ]
+        return self._call(method, params, error_messages, list)
+
+
+class _SyncToken(_Token):
+    """
+    Participant methods, with helpers built on them that need the blocking
+    LimeSurvey client, e.g. for paging, bulk calls and streaming.
+    """
+
+    def add_participants_bulk(
+            self, survey_id, participant_data, create_token_key=True,
+            chunk_size=500, min_chunk_size=10, max_chunk_size=5000,
+            target_seconds=5.0, max_bytes=2 ** 21, workers=1):
+        """
+        Add many participants to the specified survey, in chunks.
+
+        The participants are read from participant_data (which may be a
+        generator) and sent with add_participants in chunks. The chunk size
+        starts at chunk_size, is halved when a call takes longer than
+        target_seconds or sends more than max_bytes, and grows when calls are
+        well within both. A chunk rejected by the server as too large is
+        split and sent again. A failed chunk doesn't stop the others.
+
+        Only available with the blocking LimeSurvey client.
+
+        Parameters
+        :param survey_id: ID of survey to add participants.
+        :type survey_id: Integer
+        :param participant_data: Participant detail dictionaries.
+        :type participant_data: Iterable[Dict]
+        :param create_token_key: If True, generate the new token instead of
+          using a provided value.
+        :type create_token_key: Bool
+        :param chunk_size: Number of participants in the first chunk.
+        :type chunk_size: Integer
+        :param min_chunk_size: Smallest chunk size to adapt to.
+        :type min_chunk_size: Integer
+        :param max_chunk_size: Largest chunk size to adapt to.
+        :type max_chunk_size: Integer
+        :param target_seconds: Longest time a chunk should take.
+        :type target_seconds: Float
+        :param max_bytes: Largest JSON payload a chunk should have.
+        :type max_bytes: Integer
+        :param workers: Number of chunks to send concurrently.
+        :type workers: Integer
+
+        :return: result with, per input row, the created participant or the
+          error. See _BulkAddResult.
+        """
+        adder = _BulkAdder(
+            self, survey_id, create_token_key=create_token_key,
+            chunk_size=chunk_size, min_chunk_size=min_chunk_size,
+            max_chunk_size=max_chunk_size, target_seconds=target_seconds,
+            max_bytes=max_bytes)
+        return adder.run(participant_data, workers=workers)
+
+    def delete_participants_bulk(
+            self, survey_id, token_ids, chunk_size=500, workers=1,
+            progress=None):
+        """
+        Delete many participants (by token) from the specified survey.
+
+        The token IDs are sent with delete_participants in chunks, with up to
+        `workers` chunks in flight, and the results are merged. A failed
+        chunk doesn't stop the others. Only available with the blocking
+        LimeSurvey client.
+
+        Parameters
+        :param survey_id: ID of survey to delete participants from.
+        :type survey_id: Integer
+        :param token_ids: List of token IDs for participants to delete.
+        :type token_ids: List[Integer]
+        :param chunk_size: Number of token IDs per call.
+        :type chunk_size: Integer
+        :param workers: Number of chunks to send concurrently.
+        :type workers: Integer
+        :param progress: Function called after each chunk with the number of
+          tokens deleted, failed and remaining.
+        :type progress: Callable[[Integer, Integer, Integer], None]
+
+        :return: merged results by token ID. See _BulkTokenResult.
+        """
+        def call(chunk):
+            return self.delete_participants(
+                survey_id=survey_id, token_ids=chunk)
+        runner = _BulkTokenRunner(
+            call, lambda x: x == "Deleted", chunk_size=chunk_size,
+            workers=workers, progress=progress)
+        return runner.run(token_ids)
+
+    def mirror_participants(
+            self, survey_id, max_age=300, path=None, attributes=None,
+            page_size=1000):
+        """
+        Keep a local copy of a survey's participants for property lookups.
+
+        After this, get_participant_properties calls for the survey through
+        this client are answered from the mirror instead of the server. The
+        mirror is rebuilt with list_participants when older than max_age,
+        or after any other write to the survey through this client, such as
+        add_participants, and participants deleted with delete_participants
+        are removed from it.
+
+        Only available with the blocking LimeSurvey client.
+
+        Parameters
+        :param survey_id: ID of survey to mirror participants of.
+        :type survey_id: Integer
+        :param max_age: Seconds after which the mirror is rebuilt.
+        :type max_age: Float
+        :param path: (optional) Path of an SQLite file to keep the mirror
+          in, instead of memory.
+        :type path: String
+        :param attributes: (optional) Token attributes to mirror, by default
+          the standard ones. Add "attribute_1" etc. for custom attributes.
+        :type attributes: List[String]
+        :param page_size: Number of participants to fetch per request.
+        :type page_size: Integer
+
+        :return: ParticipantMirror, which can be detached with detach().
+        """
+        mirror = ParticipantMirror(
+            self.api, survey_id, max_age=max_age, path=path,
+            attributes=attributes, page_size=page_size)
+        mirror.refresh()
+        mirror.attach()
+        return mirror
+
+    def invite_participants_bulk(
+            self, survey_id, token_ids, uninvited_only=True, chunk_size=50,
+            workers=1, progress=None):
+        """
+        Send invitation emails for many survey participants.
+
+        The token IDs are sent with invite_participants in chunks, with up to
+        `workers` chunks in flight, and the results are merged. Keep
+        chunk_size at or below the server's email batch size, or the tokens
+        over it are left unsent. A failed chunk doesn't stop the others.
+        Only available with the blocking LimeSurvey client.
+
+        Parameters
+        :param survey_id: ID of survey to invite participants from.
+        :type survey_id: Integer
+        :param token_ids: List of token IDs for participants to invite.
+        :type token_ids: List[Integer]
+        :param uninvited_only: If True, only send emails for participants that
+          have not been invited. If False, send an invite even if already sent.
+        :type uninvited_only: Bool
+        :param chunk_size: Number of token IDs per call.
+        :type chunk_size: Integer
+        :param workers: Number of chunks to send concurrently.
+        :type workers: Integer
+        :param progress: Function called after each chunk with the number of
+          invitations sent, failed and remaining.
+        :type progress: Callable[[Integer, Integer, Integer], None]
+
+        :return: merged results by token ID. See _BulkTokenResult.
+        """
+        def call(chunk):
+            return self.invite_participants(
+                survey_id=survey_id, token_ids=chunk,
+                uninvited_only=uninvited_only)
+        runner = _BulkTokenRunner(
+            call, lambda x: type(x) is dict and x.get("status") == "OK",
+            chunk_size=chunk_size, workers=workers, progress=progress)
+        return runner.run(token_ids)
+
+    def stream_participants(
+            self, survey_id, start=0, limit=50000, ignore_token_used=False,
+            attributes=False, conditions=None, chunk_size=65536):
+        """
+        Yield participants in a survey, as they are read from the response.
+
+        Like list_participants, but the response is parsed incrementally, so
+        the first participants are available before the rest have arrived,
+        and the page is never held in memory as a whole. This makes large
+        pages practical, for fewer round trips. Only available with the
+        blocking LimeSurvey client.
+
+        Parameters
+        :param chunk_size: Bytes to read from the response at a time.
+        :type chunk_size: Integer
+
+        See list_participants for the other parameters.
+
+        Return
+        :return: iterator of participants.
+        :raise: LimeSurveyError, when iteration starts, for error statuses.
+        """
+        method = "list_participants"
+        params = self._list_participants_params(
+            survey_id, start, limit, ignore_token_used, attributes,
+            conditions)
+        return self._stream_items(
+            method, params, LIST_PARTICIPANTS_ERRORS, chunk_size)
+
+    def iter_participants(
+            self, survey_id, page_size=1000, ignore_token_used=False,
+            attributes=False, conditions=None, prefetch=False):
+        """
+        Iterate over the participants in a survey, fetching them page by page.
+
+        Pages are requested with list_participants as the iteration reaches
+        them, so memory use depends on page_size and not the survey size. A
+        "No survey participants found." status ends the iteration instead of
+        raising an error. The returned iterator has `pages` and `page_times`
+        attributes with the number of pages fetched and their fetch times.
+
+        Only available with the blocking LimeSurvey client.
+
+        Parameters
+        :param survey_id: ID of survey to list participants from.
+        :type survey_id: Integer
+        :param page_size: Number of tokens to retrieve per request.
+        :type page_size: Integer
+        :param ignore_token_used: If True, tokens that have been used are not
+          returned.
+        :type ignore_token_used: Bool
+        :param attributes: The extended attributes to include in the response.
+        :type attributes: List[String]
+        :param conditions: Key(s) / value(s) to use for finding the
+          participant among all those that are in the survey.
+        :type conditions: List[Dict]
+        :param prefetch: If True, fetch the next page in a background thread
+          while the current page is consumed.
+        :type prefetch: Bool
+        """
+        return _ParticipantPager(
+            self, survey_id, page_size=page_size, prefetch=prefetch,
+            ignore_token_used=ignore_token_used, attributes=attributes,
+            conditions=conditions)
+
+    def fetch_all_participants(
+            self, survey_id, workers=4, page_size=1000,
+            ignore_token_used=False, attributes=False, conditions=None):
+        """
+        List all participants in a survey, fetching pages concurrently.
+
+        The token_count from get_summary decides which pages to request, and
+        up to `workers` list_participants calls are sent at once. Each worker
+        thread uses its own connection from the client's pool, so the pool
+        should have at least `workers` connections (pool_maxsize). The pages
+        are merged in order, and participants that shifted between pages
+        during the fetch are only returned once.
+
+        Only available with the blocking LimeSurvey client.
+
+        Parameters
+        :param survey_id: ID of survey to list participants from.
+        :type survey_id: Integer
+        :param workers: Number of pages to fetch concurrently.
+        :type workers: Integer
+        :param page_size: Number of tokens to retrieve per request.
+        :type page_size: Integer
+        :param ignore_token_used: If True, tokens that have been used are not
+          returned.
+        :type ignore_token_used: Bool
+        :param attributes: The extended attributes to include in the response.
+        :type attributes: List[String]
+        :param conditions: Key(s) / value(s) to use for finding the
+          participant among all those that are in the survey.
+        :type conditions: List[Dict]
+        """
+        summary = self.get_summary(survey_id=survey_id)
+        count = int(summary["token_count"])
+        pager = _ParticipantPager(
+            self, survey_id, page_size=page_size,
+            ignore_token_used=ignore_token_used, attributes=attributes,
+            conditions=conditions)
+        return pager.fetch_all(count=count, workers=workers)
+
+    def sync_participants(
+            self, survey_id, desired_rows, key="email", dry_run=False,
+            chunk_size=500, workers=1):
+        """
+        Make a survey's participants match the desired rows, with the fewest
+        adds and deletes.
+
+        The current participants are fetched with list_participants, and
+        matched to the desired rows by the key field. Desired rows without a
+        match are added, participants without a desired row are deleted,
+        and matched participants are only replaced (deleted and added again)
+        if one of the fields in their desired row differs. Participants that
+        are left alone keep their token and invitation state. If the desired
+        rows have a "token" field, added participants keep that token.
+
+        Only available with the blocking LimeSurvey client.
+
+        Parameters
+        :param survey_id: ID of survey to sync participants of.
+        :type survey_id: Integer
+        :param desired_rows: Participant detail dictionaries.
+        :type desired_rows: Iterable[Dict]
+        :param key: Field that identifies a participant.
+        :type key: String
+        :param dry_run: If True, only work out the changes.
+        :type dry_run: Bool
+        :param chunk_size: Number of participants per add or delete call.
+        :type chunk_size: Integer
+        :param workers: Number of chunks to send concurrently.
+        :type workers: Integer
+
+        :return: report of the changes. See _SyncReport.
+        """
+        desired_rows = list(desired_rows)
+        fields = set(field for row in desired_rows for field in row)
+        attributes = sorted(
+            fields - ID_FIELDS - {"firstname", "lastname", "email"})
+        current = (flatten_participant(x) for x in self.iter_participants(
+            survey_id, attributes=attributes or False))
+        report = diff_participants(current, desired_rows, key, dry_run)
+        if dry_run:
+            return report
+        if report.to_delete:
+            report.delete_result = self.delete_participants_bulk(
+                survey_id, report.to_delete, chunk_size=chunk_size,
+                workers=workers)
+        if report.to_add:
+            report.add_result = self.add_participants_bulk(
+                survey_id, report.to_add,
+                create_token_key="token" not in fields,
+                chunk_size=chunk_size, workers=workers)
+        return report
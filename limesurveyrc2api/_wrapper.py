@@ -0,0 +1,72 @@
+from functools import partial
+from limesurveyrc2api.exceptions import LimeSurveyError
+from limesurveyrc2api._stream import iter_result_items
+
+
+def check_response(method, response, error_messages, response_type):
+    """
+    Check the result of an API call, and return it if it is not an error.
+
+    The API reports most errors as a dict with a "status" message, so the
+    status is compared against the known error messages for the method.
+
+    Parameters
+    :param method: Name of the API method that was called.
+    :type method: String
+    :param response: Result of the API call.
+    :type response: Any
+    :param error_messages: Status messages that indicate an error.
+    :type error_messages: List[String]
+    :param response_type: Expected type of a successful result.
+    :type response_type: Type
+
+    Return
+    :return: the response
+    :raise: LimeSurveyError if the response status is an error message
+    """
+    if type(response) is dict and "status" in response:
+        status = response["status"]
+        for message in error_messages:
+            if status == message:
+                raise LimeSurveyError(method, status)
+    else:
+        assert type(response) is response_type
+    return response
+
+
+class _Wrapper(object):
+    """Base class for the groups of API methods, e.g. _Survey and _Token."""
+
+    def __init__(self, api):
+        self.api = api
+
+    def _call(self, method, params, error_messages, response_type):
+        """
+        Call the API method through the client, and check the response.
+
+        The client decides how the call is made, so the return value is
+        whatever api.call returns, e.g. the result or a Future for it.
+        """
+        check = partial(
+            check_response, method, error_messages=error_messages,
+            response_type=response_type)
+        return self.api.call(method=method, params=params, check=check)
+
+    def _stream_items(self, method, params, error_messages, chunk_size):
+        """
+        Call the API method, and yield the items of its array result as they
+        are parsed from the response.
+
+        The call is made when iteration starts. It bypasses the client's
+        cache, mirrors, listeners and hooks, like other streamed calls.
+        """
+        response, items, result = self.api.read_stream(
+            method, params, iter_result_items, chunk_size)
+        try:
+            if items is None:
+                check_response(method, result, error_messages, list)
+                items = result
+            for item in items:
+                yield item
+        finally:
+            response.close()
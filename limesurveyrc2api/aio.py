@@ -0,0 +1,198 @@
+import asyncio
+import json
+from collections import OrderedDict
+from functools import partial
+from limesurveyrc2api.exceptions import LimeSurveyError
+from limesurveyrc2api._jsonrpc import (
+    encode_request, check_http_response, get_result)
+from limesurveyrc2api._wrapper import check_response
+from limesurveyrc2api._survey import _Survey
+from limesurveyrc2api._token import _Token
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+def client_timeout(timeout):
+    """
+    Return the aiohttp.ClientTimeout for a requests-style timeout: None, one
+    number of seconds, or a (connect, read) tuple.
+    """
+    if timeout is None:
+        return aiohttp.ClientTimeout(total=None)
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+    else:
+        connect = read = timeout
+    return aiohttp.ClientTimeout(
+        total=None, sock_connect=connect, sock_read=read)
+
+
+class AsyncLimeSurvey(object):
+    """
+    Asyncio client for the LimeSurvey API, using aiohttp.
+
+    The survey and token attributes have the same methods as LimeSurvey, but
+    each returns a coroutine, e.g. `await api.token.get_summary(survey_id)`.
+    The parameters and the result checks are shared with LimeSurvey.
+    """
+
+    def __init__(self, url, username, max_concurrency=100, limit=100,
+                 limit_per_host=0, keep_alive=True, timeout=(10, 300)):
+        """
+        Create an asyncio client for the LimeSurvey API.
+
+        Parameters
+        :param url: URL of the LimeSurvey RemoteControl endpoint.
+        :type url: String
+        :param username: LimeSurvey username to authenticate with.
+        :type username: String
+        :param max_concurrency: Maximum number of queries in flight at once.
+        :type max_concurrency: Integer
+        :param limit: Maximum number of open connections, or 0 for no limit.
+        :type limit: Integer
+        :param limit_per_host: Maximum number of open connections per host,
+          or 0 for no limit.
+        :type limit_per_host: Integer
+        :param keep_alive: If False, close each connection after its request.
+        :type keep_alive: Bool
+        :param timeout: Seconds to wait to connect and for each read of the
+          response, as a (connect, read) tuple or one number for both. None
+          waits forever, so a server that stops responding hangs the call.
+        :type timeout: Float or Tuple[Float, Float]
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncLimeSurvey requires the aiohttp package.")
+        self.headers = {"content-type": "application/json"}
+        self.url = url
+        self.username = username
+        self.session_key = None
+        self.max_concurrency = max_concurrency
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.http = None
+        self.semaphore = None
+        self.survey = _Survey(self)  # Setup and admin of surveys.
+        self.token = _Token(self)    # Participants and their data.
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        try:
+            if self.session_key:
+                await self.close()
+        finally:
+            await self._close_transport()
+
+    def _open_transport(self):
+        """
+        Create the aiohttp session, if it is not already open.
+
+        Must be called from a running event loop.
+        """
+        if self.http is not None:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit, limit_per_host=self.limit_per_host,
+            force_close=not self.keep_alive)
+        self.http = aiohttp.ClientSession(
+            connector=connector, timeout=client_timeout(self.timeout))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _close_transport(self):
+        """
+        Close the aiohttp session and its connections.
+        """
+        if self.http is not None:
+            http = self.http
+            self.http = None
+            await http.close()
+
+    async def open(self, password):
+        """
+        Open a session in LimeSurvey.
+
+        Parameters
+        :param password: LimeSurvey password to authenticate with.
+        :type password: String
+        """
+        method = "get_session_key"
+        params = OrderedDict([
+            ("username", self.username),
+            ("password", password)
+        ])
+        error_messages = ["Invalid user name or password"]
+        check = partial(
+            check_response, method, error_messages=error_messages,
+            response_type=str)
+        self.session_key = await self.call(
+            method=method, params=params, check=check)
+
+    async def query(self, method, params):
+        """
+        Query the LimeSurvey API
+
+        See LimeSurvey.query, which this mirrors. At most max_concurrency
+        queries are sent at once; the rest wait for a free slot.
+
+        Parameters
+        :param method: Name of API method to call.
+        :type method: String
+        :param params: Parameters to the specified API call.
+        :type params: OrderedDict
+
+        Return
+        :return: result of API call
+        :raise: aiohttp.ClientError
+        :raise: asyncio.TimeoutError if the server does not respond in time.
+        :raise: LimeSurveyError if the API returns an error (either http error
+            or error message in body)
+        """
+        if not self.session_key and not method == "get_session_key":
+            raise LimeSurveyError(method, "No session open", params)
+
+        data_json = encode_request(method, params)
+
+        self._open_transport()
+        async with self.semaphore:
+            async with self.http.post(
+                    self.url, headers=self.headers, data=data_json) as resp:
+                status_code = resp.status
+                content = await resp.read()
+        check_http_response(method, status_code, content)
+
+        response_data = json.loads(content.decode("utf-8-sig"))
+        return get_result(method, response_data, status_code, content)
+
+    async def call(self, method, params, check):
+        """
+        Query the API, and check the result before returning it.
+
+        This is the entry point used by the _Survey and _Token methods.
+        """
+        return check(await self.query(method=method, params=params))
+
+    async def close(self):
+        """
+        Close an open session in LimeSurvey, and the HTTP connections with it.
+        """
+        method = "release_session_key"
+        params = OrderedDict([
+            ("sSessionKey", self.session_key)
+        ])
+        try:
+            response = await self.query(method=method, params=params)
+        finally:
+            await self._close_transport()
+
+        if response == "OK":
+            self.session_key = None
+        else:
+            raise LimeSurveyError(method, "Did not receive 'OK' response")
+
+        return response
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import deque
+import requests
+from limesurveyrc2api.exceptions import CircuitOpenError, LimeSurveyError
+from limesurveyrc2api.retry import _status_code
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker(object):
+    """
+    Fails requests fast while the LimeSurvey server is down.
+
+    Pass to LimeSurvey(breaker=...). The breaker is closed to start with,
+    and counts the outcome of the last `window` requests. When at least
+    `minimum_calls` of them were made and the ratio that failed reaches
+    `failure_ratio`, it opens: requests raise CircuitOpenError at once,
+    without being sent. After `reset_timeout` seconds it is half open, and
+    lets `probes` requests through. If they succeed it closes again, if one
+    fails it opens again.
+
+    Connection errors, timeouts and http 5xx errors count as failures; other
+    errors (e.g. a rejected request) are the server working.
+    """
+
+    def __init__(self, failure_ratio=0.5, minimum_calls=10, window=20,
+                 reset_timeout=30.0, probes=1):
+        """
+        Parameters
+        :param failure_ratio: Ratio of failed requests to open at.
+        :type failure_ratio: Float
+        :param minimum_calls: Requests to count before opening.
+        :type minimum_calls: Integer
+        :param window: Number of recent requests to count.
+        :type window: Integer
+        :param reset_timeout: Seconds to stay open before probing.
+        :type reset_timeout: Float
+        :param probes: Requests to let through when half open.
+        :type probes: Integer
+        """
+        self.failure_ratio = failure_ratio
+        self.minimum_calls = minimum_calls
+        self.reset_timeout = reset_timeout
+        self.probes = probes
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = None
+        self.times_opened = 0
+        self._state = CLOSED
+        self._probing = 0
+        self._probed = 0
+        self._half_opened = 0  # Times half open, to tell probes apart.
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """"closed", "open", or "half_open" if a probe can be made."""
+        with self._lock:
+            self._update()
+            return self._state
+
+    def health(self):
+        """State and recent failures, e.g. for a health check endpoint."""
+        with self._lock:
+            self._update()
+            return {"state": self._state,
+                    "recent_calls": len(self.outcomes),
+                    "recent_failures": self.outcomes.count(False),
+                    "times_opened": self.times_opened}
+
+    def _update(self):
+        if (self._state == OPEN and
+                time.monotonic() - self.opened_at >= self.reset_timeout):
+            self._state = HALF_OPEN
+            self._probing = 0
+            self._probed = 0
+            self._half_opened += 1
+
+    def _open(self):
+        self._state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def before(self, method):
+        """
+        Raise CircuitOpenError unless a request may be sent now.
+
+        Return
+        :return: probe to pass to record(): None if the breaker is closed,
+          or which half open period the request is a probe in.
+        """
+        with self._lock:
+            self._update()
+            if self._state == CLOSED:
+                return None
+            if self._state == HALF_OPEN and self._probing < self.probes:
+                self._probing += 1
+                return self._half_opened
+            retry_in = max(
+                0.0, self.opened_at + self.reset_timeout - time.monotonic())
+            raise CircuitOpenError(
+                method, "Circuit open", "Retry in %.1fs" % retry_in)
+
+    def is_failure(self, error):
+        """True if the error counts as the server failing."""
+        if isinstance(error, LimeSurveyError):
+            status_code = _status_code(error)
+            return status_code is not None and status_code >= 500
+        return isinstance(error, requests.RequestException)
+
+    def record(self, error=None, probe=None):
+        """
+        Count the outcome of a request let through by before().
+
+        Only the probes of the current half open period count while the
+        breaker is half open; requests let through before it opened do not.
+
+        Parameters
+        :param error: Error raised for the request, if any.
+        :type error: Exception
+        :param probe: What before() returned for the request.
+        :type probe: Integer
+        """
+        failed = error is not None and self.is_failure(error)
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if probe != self._half_opened:
+                    return
+                self._probing -= 1
+                if failed:
+                    self._open()
+                elif error is None:
+                    self._probed += 1
+                    if self._probed >= self.probes:
+                        self._state = CLOSED
+                        self.outcomes.clear()
+                return
+            if self._state == OPEN or (error is not None and not failed):
+                return
+            self.outcomes.append(not failed)
+            failures = self.outcomes.count(False)
+            if (len(self.outcomes) >= self.minimum_calls and
+                    failures >= self.failure_ratio * len(self.outcomes)):
+                self._open()
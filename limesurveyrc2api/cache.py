@@ -0,0 +1,231 @@
+import copy
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Methods whose results are cached, and the survey-level methods after
+# which the cached survey list is invalidated with the survey's results.
+# Any other method that is not a read, by its prefix, invalidates only the
+# results for the survey it is called on.
+CACHED_METHODS = {"list_surveys", "list_groups", "list_questions"}
+INVALIDATING_METHODS = {
+    "import_survey", "activate_survey", "delete_survey", "copy_survey",
+    "set_survey_properties", "set_language_properties"}
+READ_PREFIXES = ("get_", "list_", "export_", "release_")
+# Most methods name the survey "iSurveyID", but activate_tokens says
+# "iSurveyId".
+SURVEY_ID_PARAMS = ("iSurveyID", "iSurveyId")
+
+MISSING = object()
+
+
+def cache_key(method, params, namespace=None):
+    """
+    Key for a call: the namespace (e.g. the server and user), the method
+    and its parameters, less the session key.
+    """
+    return json.dumps(
+        [namespace, method,
+         [[k, v] for k, v in params.items() if k != "sSessionKey"]],
+        sort_keys=True)
+
+
+def call_survey_id(method, params):
+    """
+    Return the ID of the survey a call is made on, as a string, or None.
+    """
+    # list_surveys passes the username as "iSurveyID", so it has no survey.
+    if method == "list_surveys":
+        return None
+    for name in SURVEY_ID_PARAMS:
+        if params.get(name) is not None:
+            return str(params[name])
+    return None
+
+
+class _BaseCache(object):
+    """
+    Common logic of the response caches; subclasses provide the storage.
+
+    `hits` and `misses` count the lookups, `evictions` the entries dropped
+    to keep within maxsize. Results are kept apart by the namespace the
+    client gives, its URL and username, so clients of different servers or
+    accounts can share a cache.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        """
+        Parameters
+        :param maxsize: Maximum number of cached results; the least recently
+          used are dropped first.
+        :type maxsize: Integer
+        :param ttl: Seconds a result stays cached.
+        :type ttl: Float
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+
+    def get(self, method, params, namespace=None):
+        """
+        Return the cached result of the call, or MISSING.
+        """
+        with self._lock:
+            result = self._get(
+                cache_key(method, params, namespace), time.time())
+            if result is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def set(self, method, params, result, namespace=None):
+        """
+        Cache the result of the call.
+        """
+        with self._lock:
+            self._set(cache_key(method, params, namespace),
+                      call_survey_id(method, params), result,
+                      time.time() + self.ttl)
+
+    def invalidate(self, survey_id=None, surveys=True):
+        """
+        Drop the cached results for the survey, or for all surveys if
+        survey_id is None, and the cached list_surveys results if surveys.
+        """
+        with self._lock:
+            self._invalidate(
+                None if survey_id is None else str(survey_id), surveys)
+
+    def after_call(self, method, params, result):
+        """
+        Invalidate the affected results after a call that changes surveys:
+        the survey list and the survey's results after a survey-level
+        write, such as activate_survey, and only the survey's results after
+        any other write to it, such as add_participants.
+        """
+        if method == "import_survey":
+            if type(result) is int:
+                self.invalidate(result)
+        elif method in INVALIDATING_METHODS:
+            self.invalidate(call_survey_id(method, params))
+        elif not method.startswith(READ_PREFIXES):
+            survey_id = call_survey_id(method, params)
+            if survey_id is not None:
+                self.invalidate(survey_id, surveys=False)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "size": len(self)}
+
+
+class MemoryCache(_BaseCache):
+    """
+    In-memory TTL and LRU cache of survey metadata calls.
+
+    Pass to LimeSurvey(cache=...) to cache list_surveys, list_groups and
+    list_questions results. Callers get their own copy of cached results.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.entries = OrderedDict()
+
+    def _get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return MISSING
+        survey_id, result, expires = entry
+        if expires < now:
+            del self.entries[key]
+            return MISSING
+        self.entries.move_to_end(key)
+        return copy.deepcopy(result)
+
+    def _set(self, key, survey_id, result, expires):
+        self.entries[key] = (survey_id, copy.deepcopy(result), expires)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _invalidate(self, survey_id, surveys):
+        for key, entry in list(self.entries.items()):
+            if entry[0] is None:
+                if surveys:
+                    del self.entries[key]
+            elif survey_id in (None, entry[0]):
+                del self.entries[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class DiskCache(_BaseCache):
+    """
+    On-disk TTL and LRU cache of survey metadata calls, in an SQLite file.
+
+    Like MemoryCache, but the cached results outlive the process and can be
+    shared by processes using the same file.
+    """
+
+    def __init__(self, path, maxsize=1024, ttl=300):
+        """
+        Parameters
+        :param path: Path of the SQLite file to keep the results in.
+        :type path: String
+        """
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, "
+                "survey_id TEXT, result TEXT, expires REAL, used REAL)")
+
+    def _get(self, key, now):
+        row = self.connection.execute(
+            "SELECT result, expires FROM cache WHERE key = ?",
+            (key,)).fetchone()
+        if row is None:
+            return MISSING
+        with self.connection:
+            if row[1] < now:
+                self.connection.execute(
+                    "DELETE FROM cache WHERE key = ?", (key,))
+                return MISSING
+            self.connection.execute(
+                "UPDATE cache SET used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def _set(self, key, survey_id, result, expires):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, survey_id, json.dumps(result), expires, time.time()))
+            excess = len(self) - self.maxsize
+            if excess > 0:
+                self.connection.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                    "ORDER BY used LIMIT ?)", (excess,))
+                self.evictions += excess
+
+    def _invalidate(self, survey_id, surveys):
+        with self.connection:
+            if surveys:
+                self.connection.execute(
+                    "DELETE FROM cache WHERE survey_id IS NULL")
+            if survey_id is None:
+                self.connection.execute(
+                    "DELETE FROM cache WHERE survey_id IS NOT NULL")
+            else:
+                self.connection.execute(
+                    "DELETE FROM cache WHERE survey_id = ?", (survey_id,))
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM cache").fetchone()[0]
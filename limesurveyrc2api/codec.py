@@ -0,0 +1,107 @@
+import codecs
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+
+def strip_bom(content):
+    """
+    Remove a UTF-8 byte order mark from the start of a response body, which
+    some PHP installs send, and which the decoders reject.
+    """
+    if content.startswith(codecs.BOM_UTF8):
+        return content[len(codecs.BOM_UTF8):]
+    return content
+
+
+class JsonCodec(object):
+    """
+    Encodes requests to, and decodes responses from, JSON bytes.
+
+    This one uses the standard library json module. The others are faster,
+    but need their library installed. All of them keep the order of dict
+    keys, which the API depends on as it treats parameters as positional.
+    """
+
+    name = "json"
+
+    def dumps(self, data):
+        return json.dumps(data).encode("utf-8")
+
+    def loads(self, content):
+        return json.loads(strip_bom(content).decode("utf-8"))
+
+
+class OrjsonCodec(JsonCodec):
+    """Encodes and decodes with orjson."""
+
+    name = "orjson"
+
+    def dumps(self, data):
+        # Allow non-string keys, like the json module does.
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, content):
+        return orjson.loads(strip_bom(content))
+
+
+class UjsonCodec(JsonCodec):
+    """Encodes and decodes with ujson."""
+
+    name = "ujson"
+
+    def dumps(self, data):
+        return ujson.dumps(data, ensure_ascii=False).encode("utf-8")
+
+    def loads(self, content):
+        return ujson.loads(strip_bom(content))
+
+
+class SimdjsonCodec(JsonCodec):
+    """Decodes with simdjson, which can't encode, so encodes with json."""
+
+    name = "simdjson"
+
+    def loads(self, content):
+        return simdjson.loads(strip_bom(content))
+
+
+CODECS = [
+    (OrjsonCodec, orjson),
+    (UjsonCodec, ujson),
+    (SimdjsonCodec, simdjson),
+    (JsonCodec, json),
+]
+
+
+def get_codec(name=None):
+    """
+    Return a codec by name, or by default the fastest one installed.
+
+    Parameters
+    :param name: (optional) "orjson", "ujson", "simdjson" or "json".
+    :type name: String
+
+    Return
+    :return: JsonCodec
+    :raise: ValueError if the codec is unknown or its library not installed.
+    """
+    for codec, module in CODECS:
+        if name is None and module is not None or name == codec.name:
+            if module is None:
+                raise ValueError("JSON codec not installed: %s" % name)
+            return codec()
+    raise ValueError("Unknown JSON codec: %s" % name)
@@ -6,3 +6,7 @@ class LimeSurveyError(Exception):
         if args is not None:
             message += [str(x) for x in args]
         self.message = " | ".join(message)
+
+
+class CircuitOpenError(LimeSurveyError):
+    """Raised without querying while the circuit breaker is open."""
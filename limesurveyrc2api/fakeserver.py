@@ -0,0 +1,700 @@
+"""
+An in-process stand-in for the LimeSurvey RemoteControl JSON-RPC API.
+
+For tests and benchmarks of the client without a LimeSurvey install. It
+implements the methods the client wraps, with the result shapes and error
+statuses of the real API, and can be made slow, flaky, or to expire
+sessions.
+
+with FakeLimeSurvey() as server:
+    survey_id = server.add_survey(participants=100, responses=1000)
+    api = LimeSurvey(url=server.url, username=server.username)
+    api.open(password=server.password)
+"""
+import codecs
+import json
+import random
+import smtplib
+import threading
+import time
+import uuid
+from base64 import b64encode, b64decode
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# How the real API words the invalid session status, where it differs.
+SESSION_ERRORS = {
+    "delete_participants": "Invalid Session Key",
+    "get_participant_properties": "Invalid Session Key",
+    "list_groups": "Invalid S ession key",
+    "remind_participants": "Invalid Session Key",
+}
+
+NO_PARTICIPANTS = "No survey participants found."
+
+# Export headings of the response fields, for the "full" and "abbreviated"
+# heading types. Questions are headed by their text.
+FULL_HEADINGS = {
+    "id": "Response ID",
+    "submitdate": "Date submitted",
+    "lastpage": "Last page",
+    "startlanguage": "Start language",
+}
+
+SUMMARY_STATS = [
+    "completed_responses", "incomplete_responses", "full_responses",
+    "token_count", "token_invalid", "token_sent", "token_opted_out",
+    "token_completed"]
+
+
+class _FakeSurvey(object):
+    """Data of one survey on the fake server."""
+
+    def __init__(self, survey_id, title, language):
+        self.survey_id = survey_id
+        self.title = title
+        self.language = language
+        self.active = "N"
+        self.groups = []
+        self.questions = []
+        self.participants = OrderedDict()  # By tid.
+        self.responses = []
+        self.has_tokens = False
+        self.next_tid = 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    # The headers and body are written separately, so without this, each
+    # keep-alive response waits for the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("content-length", 0)))
+        status, data = self.server.fake.handle(body)
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeLimeSurvey(object):
+    """
+    A fake LimeSurvey server, answering RemoteControl calls on a local port.
+
+    `calls` counts the calls made per method, and `requests` the HTTP
+    requests received.
+    """
+
+    def __init__(self, username="admin", password="admin", latency=0.0,
+                 session_ttl=None, error_rate=0.0, error_status=502,
+                 seed=None, host="127.0.0.1", port=0, bom=False,
+                 smtp_host=None):
+        """
+        Parameters
+        :param username: Username to accept in get_session_key.
+        :type username: String
+        :param password: Password to accept in get_session_key.
+        :type password: String
+        :param latency: Seconds to wait before answering each request.
+        :type latency: Float
+        :param session_ttl: (optional) Seconds after which session keys
+          expire.
+        :type session_ttl: Float
+        :param error_rate: Ratio of requests to answer with error_status.
+        :type error_rate: Float
+        :param error_status: HTTP status of injected errors.
+        :type error_status: Integer
+        :param seed: (optional) Seed for the random errors and data.
+        :type seed: Integer
+        :param host: Address to listen on.
+        :type host: String
+        :param port: Port to listen on, by default any free port.
+        :type port: Integer
+        :param bom: If True, start response bodies with a UTF-8 byte order
+          mark, as some PHP installs do.
+        :type bom: Bool
+        :param smtp_host: (optional) SMTP server to email invitations and
+          reminders through, as "host:port", like LimeSurvey's setting.
+        :type smtp_host: String
+        """
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.session_ttl = session_ttl
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.bom = bom
+        self.smtp_host = smtp_host
+        self.surveys = OrderedDict()
+        self.sessions = {}  # Expiry time by session key, None for never.
+        self.failures = []  # HTTP statuses to answer the next requests with.
+        self.calls = {}
+        self.requests = 0
+        self.next_survey_id = 100000
+        self.next_id = 1
+        self._lock = threading.RLock()
+        self._server = _HTTPServer((host, port), _Handler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://%s:%d/index.php/admin/remotecontrol" % (host, port)
+
+    def start(self):
+        """Start answering requests, in a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop answering requests, and close the socket."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Setup of the fake's state.
+
+    def add_survey(self, title="Fake survey", language="en", groups=2,
+                   questions=5, participants=0, responses=0, answer_size=10,
+                   active=True):
+        """
+        Create a survey, with generated groups, questions and data.
+
+        Parameters
+        :param title: Title of the survey.
+        :type title: String
+        :param language: Base language of the survey.
+        :type language: String
+        :param groups: Number of question groups.
+        :type groups: Integer
+        :param questions: Number of questions per group.
+        :type questions: Integer
+        :param participants: Number of participants. If more than 0, the
+          survey has a participants table.
+        :type participants: Integer
+        :param responses: Number of responses.
+        :type responses: Integer
+        :param answer_size: Length of each answer in the responses.
+        :type answer_size: Integer
+        :param active: If True, the survey is active.
+        :type active: Bool
+
+        Return
+        :return: ID of the survey.
+        """
+        with self._lock:
+            survey_id = self.next_survey_id
+            self.next_survey_id += 1
+            survey = _FakeSurvey(survey_id, title, language)
+            survey.active = "Y" if active else "N"
+            for group_order in range(groups):
+                group_id = str(self._new_id())
+                survey.groups.append(OrderedDict([
+                    ("id", {"gid": group_id, "language": language}),
+                    ("gid", group_id), ("sid", str(survey_id)),
+                    ("group_name", "Group %d" % (group_order + 1)),
+                    ("group_order", str(group_order)), ("description", ""),
+                    ("language", language)]))
+                for question_order in range(questions):
+                    question_id = str(self._new_id())
+                    survey.questions.append(OrderedDict([
+                        ("id", {"qid": question_id, "language": language}),
+                        ("qid", question_id), ("parent_qid", "0"),
+                        ("sid", str(survey_id)), ("gid", group_id),
+                        ("type", "S"),
+                        ("title", "Q%s" % question_id),
+                        ("question", "Question %s?" % question_id),
+                        ("question_order", str(question_order)),
+                        ("language", language)]))
+            self.surveys[survey_id] = survey
+            if participants:
+                self.activate_tokens(survey_id)
+                self.add_participants(survey_id, [
+                    {"firstname": "First%d" % x, "lastname": "Last%d" % x,
+                     "email": "participant%d@example.com" % x}
+                    for x in range(participants)])
+            self.add_responses(survey_id, responses, answer_size)
+            return survey_id
+
+    def activate_tokens(self, survey_id):
+        """Give the survey a participants table."""
+        self.surveys[survey_id].has_tokens = True
+
+    def add_participants(self, survey_id, rows, create_token=True):
+        """
+        Add participants to the survey, as the API does.
+
+        Return
+        :return: the rows, with "tid" and "token" added, or "errors".
+        """
+        with self._lock:
+            survey = self.surveys[survey_id]
+            created = []
+            for row in rows:
+                row = OrderedDict(row)
+                if "@" not in row.get("email", "@"):
+                    row["errors"] = {
+                        "email": ["Email address is not valid."]}
+                    created.append(row)
+                    continue
+                tid = survey.next_tid
+                survey.next_tid += 1
+                participant = OrderedDict([
+                    ("tid", str(tid)), ("participant_id", None),
+                    ("firstname", ""), ("lastname", ""), ("email", ""),
+                    ("emailstatus", "OK"), ("token", ""),
+                    ("language", survey.language), ("blacklisted", None),
+                    ("sent", "N"), ("remindersent", "N"),
+                    ("remindercount", "0"), ("completed", "N"),
+                    ("usesleft", "1"), ("validfrom", None),
+                    ("validuntil", None), ("mpid", None)])
+                participant.update(row)
+                participant["tid"] = str(tid)
+                if create_token and not participant["token"]:
+                    participant["token"] = uuid.uuid4().hex[:15]
+                survey.participants[participant["tid"]] = participant
+                created.append(participant.copy())
+            return created
+
+    def add_responses(self, survey_id, count, answer_size=10):
+        """Add generated responses to the survey."""
+        with self._lock:
+            survey = self.surveys[survey_id]
+            for _ in range(count):
+                response = OrderedDict([
+                    ("id", len(survey.responses) + 1),
+                    ("submitdate", "2017-01-01 00:00:00"),
+                    ("lastpage", 1), ("startlanguage", survey.language)])
+                for question in survey.questions:
+                    response[question["title"]] = "".join(
+                        self.random.choice("abcdefghij")
+                        for _ in range(answer_size))
+                survey.responses.append(response)
+
+    def fail_next(self, status=502, count=1):
+        """Answer the next requests with an HTTP error status."""
+        with self._lock:
+            self.failures.extend([status] * count)
+
+    def expire_sessions(self):
+        """Make all the session keys invalid, as if they timed out."""
+        with self._lock:
+            self.sessions.clear()
+
+    def _new_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    # Handling of requests.
+
+    def handle(self, body):
+        """
+        Answer a JSON-RPC request body.
+
+        Return
+        :return: tuple of the HTTP status and response body.
+        """
+        with self._lock:
+            self.requests += 1
+            if self.failures:
+                status = self.failures.pop(0)
+            elif self.error_rate and self.random.random() < self.error_rate:
+                status = self.error_status
+            else:
+                status = None
+        if self.latency:
+            time.sleep(self.latency)
+        if status is not None:
+            return status, b"Server error"
+        try:
+            request = json.loads(body.decode("utf-8"))
+        except ValueError:
+            return 200, self._encode(
+                {"id": None, "result": None, "error": "Parse error"})
+        if type(request) is list:
+            return 200, self._encode([self._answer(x) for x in request])
+        return 200, self._encode(self._answer(request))
+
+    def _encode(self, data):
+        if self.bom:
+            return codecs.BOM_UTF8 + json.dumps(data).encode("utf-8")
+        return json.dumps(data).encode("utf-8")
+
+    def _answer(self, request):
+        method = request.get("method")
+        params = request.get("params") or []
+        handler = getattr(self, "_rpc_%s" % method, None)
+        response = OrderedDict([
+            ("id", request.get("id")), ("result", None), ("error", None)])
+        if handler is None:
+            response["error"] = "Method not found"
+            return response
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if type(params) is dict:
+                args = list(params.values())
+            else:
+                args = list(params)
+            # The real API releases any session key, valid or not.
+            if method not in ("get_session_key", "release_session_key"):
+                if not self._session_valid(args[0] if args else None):
+                    response["result"] = {"status": SESSION_ERRORS.get(
+                        method, "Invalid session key")}
+                    return response
+                args = args[1:]
+            response["result"] = handler(*args)
+        return response
+
+    def _session_valid(self, session_key):
+        if session_key not in self.sessions:
+            return False
+        expires = self.sessions[session_key]
+        if expires is not None and expires < time.monotonic():
+            del self.sessions[session_key]
+            return False
+        return True
+
+    def _survey(self, survey_id):
+        try:
+            return self.surveys.get(int(survey_id))
+        except (TypeError, ValueError):
+            return None
+
+    # RemoteControl methods, taking the params after the session key.
+
+    def _rpc_get_session_key(self, username=None, password=None, *args):
+        if username != self.username or password != self.password:
+            return {"status": "Invalid user name or password"}
+        session_key = uuid.uuid4().hex
+        self.sessions[session_key] = (
+            None if self.session_ttl is None
+            else time.monotonic() + self.session_ttl)
+        return session_key
+
+    def _rpc_release_session_key(self, session_key=None, *args):
+        self.sessions.pop(session_key, None)
+        return "OK"
+
+    def _rpc_list_surveys(self, username=None, *args):
+        if username is not None and username != self.username:
+            return {"status": "Invalid user"}
+        if not self.surveys:
+            return {"status": "No surveys found"}
+        return [OrderedDict([
+            ("sid", str(x.survey_id)), ("surveyls_title", x.title),
+            ("startdate", None), ("expires", None), ("active", x.active)])
+            for x in self.surveys.values()]
+
+    def _rpc_list_groups(self, survey_id=None, *args):
+        survey = self._survey(survey_id)
+        if survey is None:
+            return {"status": "Error: Invalid survey ID"}
+        if not survey.groups:
+            return {"status": "No groups found"}
+        return [dict(x) for x in survey.groups]
+
+    def _rpc_list_questions(self, survey_id=None, group_id=None,
+                            language=None, *args):
+        survey = self._survey(survey_id)
+        if survey is None:
+            return {"status": "Error: Invalid survey ID"}
+        if language is not None and language != survey.language:
+            return {"status": "Error: Invalid language"}
+        questions = survey.questions
+        if group_id is not None:
+            if not any(str(x["gid"]) == str(group_id) for x in survey.groups):
+                return {"status": "Error: IMissmatch in surveyid and groupid"}
+            questions = [x for x in questions
+                         if str(x["gid"]) == str(group_id)]
+        if not questions:
+            return {"status": "No questions found"}
+        return [dict(x) for x in questions]
+
+    def _rpc_delete_survey(self, survey_id=None, *args):
+        if self._survey(survey_id) is None:
+            return {"status": "No permission"}
+        del self.surveys[int(survey_id)]
+        return {"status": "OK"}
+
+    def _rpc_import_survey(self, import_data=None, import_type=None,
+                           new_name=None, dest_survey_id=None, *args):
+        if import_type not in ("lss", "csv", "txt", "lsa"):
+            return {"status": "Invalid extension"}
+        try:
+            b64decode(import_data or "")
+        except (TypeError, ValueError):
+            return {"status": "Error: Invalid import data"}
+        survey_id = self.add_survey(
+            title=new_name or "Imported survey", active=False)
+        if dest_survey_id and int(dest_survey_id) not in self.surveys:
+            self.surveys[int(dest_survey_id)] = self.surveys.pop(survey_id)
+            self.surveys[int(dest_survey_id)].survey_id = int(dest_survey_id)
+            survey_id = int(dest_survey_id)
+        return survey_id
+
+    def _rpc_activate_survey(self, survey_id=None, *args):
+        survey = self._survey(survey_id)
+        if survey is None:
+            return {"status": "Error: Invalid survey ID"}
+        survey.active = "Y"
+        return {"status": "OK", "pluginFeedback": []}
+
+    def _rpc_activate_tokens(self, survey_id=None, attribute_fields=None,
+                             *args):
+        survey = self._survey(survey_id)
+        if survey is None:
+            return {"status": "Error: Invalid survey ID"}
+        survey.has_tokens = True
+        return {"status": "OK"}
+
+    def _rpc_export_responses(self, survey_id=None, document_type=None,
+                              language_code=None, completion_status="all",
+                              heading_type="code", response_type="short",
+                              from_response_id=None, to_response_id=None,
+                              fields=None, *args):
+        survey = self._survey(survey_id)
+        if survey is None:
+            return {"status": "No permission"}
+        if language_code is not None and language_code != survey.language:
+            return {"status": "Language code not found for this survey."}
+        if not survey.responses:
+            return {"status": "No Data, could not get max id."}
+        low = from_response_id or 1
+        high = to_response_id or len(survey.responses)
+        rows = [x for x in survey.responses if low <= x["id"] <= high]
+        if fields:
+            rows = [OrderedDict((k, v) for k, v in x.items() if k in fields)
+                    for x in rows]
+        if heading_type in ("full", "abbreviated"):
+            headings = dict(FULL_HEADINGS)
+            for question in survey.questions:
+                text = question["question"]
+                if heading_type == "abbreviated" and len(text) > 15:
+                    text = text[:15] + ".."
+                headings[question["title"]] = text
+            rows = [OrderedDict((headings[k], v) for k, v in x.items())
+                    for x in rows]
+        if document_type == "json":
+            data = json.dumps({"responses": [
+                {str(next(iter(x.values()))): OrderedDict(
+                    (k, str(v)) for k, v in x.items())}
+                for x in rows]}).encode("utf-8")
+        elif document_type == "csv":
+            header = list(rows[0]) if rows else list(
+                survey.responses[0])
+            lines = [",".join('"%s"' % x for x in header)]
+            for row in rows:
+                lines.append(",".join('"%s"' % row[x] for x in header))
+            data = ("\ufeff" + "\r\n".join(lines) + "\r\n").encode("utf-8")
+        else:
+            data = ("%s export of survey %s, %d responses" % (
+                document_type, survey.survey_id, len(rows))).encode("utf-8")
+        return b64encode(data).decode("ascii")
+
+    def _token_survey(self, survey_id):
+        """Return the survey and None, or None and the error result."""
+        survey = self._survey(survey_id)
+        if survey is None:
+            return None, {"status": "Error: Invalid survey ID"}
+        if not survey.has_tokens:
+            return None, {"status": "Error: No token table"}
+        return survey, None
+
+    def _rpc_add_participants(self, survey_id=None, participant_data=None,
+                              create_token=True, *args):
+        survey = self._survey(survey_id)
+        if survey is None:
+            return {"status": "Error: Invalid survey ID"}
+        if not survey.has_tokens:
+            return {"status": "No token table"}
+        return self.add_participants(
+            survey.survey_id, participant_data or [], create_token)
+
+    def _rpc_delete_participants(self, survey_id=None, token_ids=None,
+                                 *args):
+        survey, error = self._token_survey(survey_id)
+        if error:
+            return error
+        result = OrderedDict()
+        for token_id in token_ids or []:
+            if survey.participants.pop(str(token_id), None) is None:
+                result[str(token_id)] = "Invalid token ID"
+            else:
+                result[str(token_id)] = "Deleted"
+        return result
+
+    def _rpc_get_participant_properties(self, survey_id=None, query=None,
+                                        properties=None, *args):
+        survey, error = self._token_survey(survey_id)
+        if error:
+            return error
+        if type(query) is not dict:
+            if str(query) not in survey.participants:
+                return {"status": "Error: Invalid tokenid"}
+            query = {"tid": query}
+        rows = [x for x in survey.participants.values()
+                if all(str(x.get(k)) == str(v) for k, v in query.items())]
+        if not rows:
+            return {"status":
+                    "Error: No results were found based on your attributes."}
+        if len(rows) > 1:
+            return {"status": "Error: More than 1 result was found based "
+                              "on your attributes."}
+        if properties:
+            return dict((x, rows[0][x]) for x in properties
+                        if x in rows[0])
+        return dict(rows[0])
+
+    def _rpc_get_summary(self, survey_id=None, stat_name="all", *args):
+        survey = self._survey(survey_id)
+        if survey is None:
+            return {"status": "Invalid surveyid"}
+        participants = list(survey.participants.values())
+        stats = OrderedDict([
+            ("completed_responses", str(len(survey.responses))),
+            ("incomplete_responses", "0"),
+            ("full_responses", str(len(survey.responses)))])
+        if survey.has_tokens:
+            stats["token_count"] = str(len(participants))
+            stats["token_invalid"] = "0"
+            stats["token_sent"] = str(
+                sum(1 for x in participants if x["sent"] != "N"))
+            stats["token_opted_out"] = "0"
+            stats["token_completed"] = str(
+                sum(1 for x in participants if x["completed"] != "N"))
+        if stat_name == "all":
+            return stats
+        if stat_name not in SUMMARY_STATS:
+            return {"status": "Invalid summary key"}
+        if stat_name not in stats:
+            return {"status": "No available data"}
+        return {stat_name: stats[stat_name]}
+
+    def _send_emails(self, survey, token_ids, reminder, uninvited_only=True,
+                     min_days=None, max_reminders=None):
+        if token_ids:
+            token_ids = set(str(x) for x in token_ids)
+        candidates = [
+            x for x in survey.participants.values()
+            if not token_ids or x["tid"] in token_ids]
+        if reminder:
+            candidates = [x for x in candidates if x["sent"] != "N"]
+            if min_days:
+                last = time.strftime(
+                    "%Y-%m-%d %H:%M", time.localtime(
+                        time.time() - int(min_days) * 86400))
+                candidates = [x for x in candidates
+                              if x["remindersent"] in ("N", None) or
+                              x["remindersent"] < last]
+            if max_reminders:
+                candidates = [x for x in candidates
+                              if int(x["remindercount"]) < int(max_reminders)]
+        elif uninvited_only:
+            candidates = [x for x in candidates if x["sent"] == "N"]
+        if not candidates:
+            return {"status": "Error: No candidate tokens"}
+        result = OrderedDict()
+        now = time.strftime("%Y-%m-%d %H:%M")
+        for participant in candidates:
+            status = self._send_email(survey, participant, reminder)
+            if not reminder:
+                participant["sent"] = now
+            else:
+                participant["remindersent"] = now
+                participant["remindercount"] = str(
+                    int(participant["remindercount"]) + 1)
+            result[participant["tid"]] = OrderedDict([
+                ("name", "%s %s" % (
+                    participant["firstname"], participant["lastname"])),
+                ("email", participant["email"]), ("status", status)])
+        result["status"] = "0 left to send"
+        return result
+
+    def _send_email(self, survey, participant, reminder):
+        if self.smtp_host is None:
+            return "OK"
+        host, _, port = self.smtp_host.partition(":")
+        message = "Subject: %s to %s\r\n\r\nYour token is %s.\r\n" % (
+            "Reminder" if reminder else "Invitation", survey.title,
+            participant["token"])
+        try:
+            smtp = smtplib.SMTP(host, int(port or 25))
+            try:
+                smtp.sendmail("admin@example.com", [participant["email"]],
+                              message)
+            finally:
+                smtp.quit()
+        except (smtplib.SMTPException, OSError) as e:
+            return "Error: %s" % e
+        return "OK"
+
+    def _rpc_invite_participants(self, survey_id=None, token_ids=None,
+                                 uninvited_only=True, *args):
+        survey, error = self._token_survey(survey_id)
+        if error:
+            return error
+        return self._send_emails(
+            survey, token_ids, False, uninvited_only)
+
+    def _rpc_remind_participants(self, survey_id=None, min_days=None,
+                                 max_reminders=None, token_ids=None, *args):
+        survey, error = self._token_survey(survey_id)
+        if error:
+            return {"status": "Error: No survey participants table"} \
+                if error["status"] == "Error: No token table" else error
+        return self._send_emails(
+            survey, token_ids, True, min_days=min_days,
+            max_reminders=max_reminders)
+
+    def _rpc_list_participants(self, survey_id=None, start=0, limit=10,
+                               unused=False, attributes=False,
+                               conditions=None, *args):
+        survey, error = self._token_survey(survey_id)
+        if error:
+            return error
+        rows = list(survey.participants.values())
+        if unused:
+            rows = [x for x in rows if x["completed"] == "N"]
+        if conditions:
+            rows = [x for x in rows if all(
+                str(x.get(k)) == str(v) for k, v in conditions.items())]
+        rows = rows[start:start + limit]
+        if not rows:
+            return {"status": NO_PARTICIPANTS}
+        result = []
+        for row in rows:
+            item = OrderedDict([
+                ("tid", row["tid"]), ("token", row["token"]),
+                ("participant_info", OrderedDict([
+                    ("firstname", row["firstname"]),
+                    ("lastname", row["lastname"]),
+                    ("email", row["email"])]))])
+            for attribute in attributes or []:
+                if attribute in row:
+                    item[attribute] = row[attribute]
+            result.append(item)
+        return result
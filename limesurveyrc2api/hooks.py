@@ -0,0 +1,157 @@
+import logging
+import time
+from collections import OrderedDict
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+logger = logging.getLogger("limesurveyrc2api")
+
+
+class CallTrace(object):
+    """
+    Timings of the phases of one API call, passed to each hook.
+
+    `timings` has the seconds spent per phase, in order: "serialize" (JSON
+    encoding of the request), "network" (sending it and waiting for the
+    response, including retries), "parse" (JSON decoding of the response),
+    and "check" (checking the result for error statuses). Calls answered
+    from a cache or mirror only have "check". `phase` is the phase running,
+    or that failed. Hooks can keep their own state for the call in `data`.
+    """
+
+    def __init__(self, method, params):
+        self.method = method
+        self.params = params
+        self.started = time.perf_counter()
+        self.timings = OrderedDict()
+        self.phase = None
+        self.data = {}
+
+    def begin(self, phase):
+        self.phase = phase
+        return time.perf_counter()
+
+    def end(self, phase, started):
+        # Phases repeat if the call is sent again, e.g. to renew a session.
+        self.timings[phase] = (
+            self.timings.get(phase, 0.0) + time.perf_counter() - started)
+
+    @property
+    def elapsed(self):
+        """Seconds since the call started."""
+        return time.perf_counter() - self.started
+
+
+class Hook(object):
+    """
+    Base class for hooks into API calls, with no-op methods to override.
+
+    Add hooks with LimeSurvey(hooks=[...]), or to api.hooks. The methods are
+    called in the thread making the call, so should be quick. Calls in
+    batches are not traced.
+    """
+
+    def before_request(self, trace):
+        """Called when a call starts."""
+
+    def after_serialize(self, trace, data_json):
+        """Called with the request body, once encoded."""
+
+    def after_response(self, trace, response):
+        """Called with the requests.Response, once received."""
+
+    def after_parse(self, trace, result):
+        """Called with the result, once decoded from the response."""
+
+    def after_call(self, trace, result):
+        """Called with the checked result, when the call succeeds."""
+
+    def on_error(self, trace, error):
+        """Called with the error a call failed with, in trace.phase."""
+
+
+class SlowCallLog(Hook):
+    """
+    Logs a warning, with the phase timings, for calls slower than threshold.
+    """
+
+    def __init__(self, threshold=1.0, log=None):
+        """
+        Parameters
+        :param threshold: Seconds above which a call is logged.
+        :type threshold: Float
+        :param log: Logger to log to, by default "limesurveyrc2api".
+        :type log: logging.Logger
+        """
+        self.threshold = threshold
+        self.log = log or logger
+
+    def after_call(self, trace, result):
+        self._check(trace, "")
+
+    def on_error(self, trace, error):
+        self._check(trace, " (failed in %s: %s)" % (
+            trace.phase, getattr(error, "message", error)))
+
+    def _check(self, trace, outcome):
+        elapsed = trace.elapsed
+        if elapsed < self.threshold:
+            return
+        phases = ", ".join(
+            "%s %.3fs" % (k, v) for k, v in trace.timings.items())
+        self.log.warning("Slow call to %s: %.3fs [%s]%s",
+                         trace.method, elapsed, phases, outcome)
+
+
+class OpenTelemetryHook(Hook):
+    """
+    Records each call as an OpenTelemetry span, with the phase timings.
+
+    If the opentelemetry package is not installed, this does nothing.
+    """
+
+    def __init__(self, tracer=None):
+        """
+        Parameters
+        :param tracer: (optional) Tracer to create spans with, by default
+          the global tracer provider's "limesurveyrc2api" tracer.
+        :type tracer: opentelemetry.trace.Tracer
+        """
+        if otel_trace is None:
+            tracer = None
+        elif tracer is None:
+            tracer = otel_trace.get_tracer("limesurveyrc2api")
+        self.tracer = tracer
+
+    def before_request(self, trace):
+        if self.tracer is None:
+            return
+        span = self.tracer.start_span(
+            "limesurvey.%s" % trace.method, kind=otel_trace.SpanKind.CLIENT)
+        span.set_attribute("rpc.system", "jsonrpc")
+        span.set_attribute("rpc.method", trace.method)
+        trace.data["otel_span"] = span
+
+    def _finish(self, trace):
+        span = trace.data.pop("otel_span", None)
+        if span is not None:
+            for phase, seconds in trace.timings.items():
+                span.set_attribute("limesurvey.%s_seconds" % phase, seconds)
+        return span
+
+    def after_call(self, trace, result):
+        span = self._finish(trace)
+        if span is not None:
+            span.end()
+
+    def on_error(self, trace, error):
+        span = self._finish(trace)
+        if span is not None:
+            span.record_exception(error)
+            span.set_status(otel_trace.Status(
+                otel_trace.StatusCode.ERROR, str(error)))
+            span.set_attribute("limesurvey.failed_phase", trace.phase)
+            span.end()
@@ -0,0 +1,40 @@
+import json
+import os
+
+
+class ExportState(object):
+    """
+    The highest exported response id per survey, saved in a JSON file.
+
+    Used by _SyncSurvey.export_responses_incremental to export only the
+    responses that are new since the last run.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        :param path: Path of the JSON file to keep the state in. It is
+          created on the first save.
+        :type path: String
+        """
+        self.path = path
+        self.marks = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.marks = json.load(f)
+
+    def get(self, survey_id):
+        """
+        Return the highest exported response id of the survey, or 0.
+        """
+        return self.marks.get(str(survey_id), 0)
+
+    def set(self, survey_id, response_id):
+        """
+        Record the highest exported response id of the survey, and save.
+        """
+        self.marks[str(survey_id)] = response_id
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.marks, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
@@ -1,20 +1,157 @@
+import copy
+import threading
+import time
 import requests
-import json
+from requests.adapters import HTTPAdapter
 from collections import OrderedDict
+from functools import partial
 from limesurveyrc2api.exceptions import LimeSurveyError
-from limesurveyrc2api._survey import _Survey
-from limesurveyrc2api._token import _Token
+from limesurveyrc2api._jsonrpc import (
+    READ_METHODS, encode_request, check_http_response, get_result,
+    is_invalid_session)
+from limesurveyrc2api._wrapper import check_response
+from limesurveyrc2api._survey import _SyncSurvey
+from limesurveyrc2api._token import _SyncToken
+from limesurveyrc2api._batch import _Batch
+from limesurveyrc2api.cache import CACHED_METHODS, MISSING, cache_key
+from limesurveyrc2api._singleflight import _SingleFlight
+from limesurveyrc2api._sessionpool import _SessionPool
+from limesurveyrc2api.throttle import method_class
+from limesurveyrc2api.metrics import Metrics, error_status, render_prometheus
+from limesurveyrc2api.hooks import CallTrace
+from limesurveyrc2api.codec import get_codec
 
 
 class LimeSurvey(object):
 
-    def __init__(self, url, username):
+    def __init__(self, url, username, pool_connections=1, pool_maxsize=10,
+                 pool_block=False, max_retries=0, keep_alive=True,
+                 cache=None, coalesce=False, renew_session=True,
+                 timeout=(10, 300), retry=None, throttle=None,
+                 breaker=None, metrics=None, hooks=None, codec=None):
+        """
+        Create a client for the LimeSurvey API.
+
+        The client owns a pooled HTTP transport (a requests.Session) which is
+        reused for every query, so consecutive calls share TCP/TLS
+        connections. Release it with close(), or use the client as a context
+        manager.
+
+        Parameters
+        :param url: URL of the LimeSurvey RemoteControl endpoint.
+        :type url: String
+        :param username: LimeSurvey username to authenticate with.
+        :type username: String
+        :param pool_connections: Number of per-host connection pools to cache.
+        :type pool_connections: Integer
+        :param pool_maxsize: Maximum number of connections kept per host.
+        :type pool_maxsize: Integer
+        :param pool_block: If True, wait for a free connection when the pool
+          is exhausted instead of opening a throwaway one.
+        :type pool_block: Bool
+        :param max_retries: Retries for failed connections, or a
+          urllib3.util.Retry instance for finer control.
+        :type max_retries: Integer or urllib3.util.Retry
+        :param keep_alive: If False, ask the server to close the connection
+          after each request.
+        :type keep_alive: Bool
+        :param cache: (optional) Cache for list_surveys, list_groups and
+          list_questions results, which is invalidated by import_survey,
+          activate_survey and delete_survey calls.
+        :type cache: limesurveyrc2api.cache.MemoryCache or DiskCache
+        :param coalesce: If True, identical read-only queries made by several
+          threads at once are sent once, and all of them get its result.
+        :type coalesce: Bool
+        :param renew_session: If True, keep the password given to open(), and
+          when a query fails because the session key expired, open a new
+          session and send the query again.
+        :type renew_session: Bool
+        :param timeout: Seconds to wait to connect and for each read of the
+          response, as a (connect, read) tuple or one number for both. None
+          waits forever, so a server that stops responding hangs the call.
+        :type timeout: Float or Tuple[Float, Float]
+        :param retry: (optional) Policy for sending failed requests again.
+        :type retry: limesurveyrc2api.retry.RetryPolicy
+        :param throttle: (optional) Rate and concurrency limits for requests,
+          or a dict of them by method class: "export", "token", "default".
+        :type throttle: limesurveyrc2api.throttle.Throttle or Dict
+        :param breaker: (optional) Circuit breaker, to fail requests fast
+          while the server is down.
+        :type breaker: limesurveyrc2api.breaker.CircuitBreaker
+        :param metrics: (optional) Metrics to record calls in, e.g. to share
+          them between clients. By default the client has its own.
+        :type metrics: limesurveyrc2api.metrics.Metrics
+        :param hooks: (optional) Hooks called around the phases of each call,
+          e.g. for tracing or logging slow calls.
+        :type hooks: List[limesurveyrc2api.hooks.Hook]
+        :param codec: (optional) JSON codec for requests and responses, by
+          default the fastest installed: orjson, ujson, simdjson or json.
+        :type codec: limesurveyrc2api.codec.JsonCodec
+        """
         self.headers = {"content-type": "application/json"}
+        if not keep_alive:
+            self.headers["connection"] = "close"
         self.url = url
         self.username = username
         self.session_key = None
-        self.survey = _Survey(self)  # Setup and admin of surveys.
-        self.token = _Token(self)    # Participants and their data.
+        self.renew_session = renew_session
+        self._password = None
+        self._renew_lock = threading.Lock()
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.retry = retry
+        self.throttle = throttle
+        self.breaker = breaker
+        self.call_metrics = Metrics() if metrics is None else metrics
+        self.hooks = list(hooks or [])
+        self.codec = get_codec() if codec is None else codec
+        self._local = threading.local()  # Trace of the call in progress.
+        self.http = None
+        self.batch_supported = True
+        self.cache = cache
+        self.single_flight = _SingleFlight() if coalesce else None
+        self.mirrors = {}    # Local participant mirrors, by survey id.
+        self.listeners = []  # Called with (method, params, result).
+        self.survey = _SyncSurvey(self)  # Setup and admin of surveys.
+        self.token = _SyncToken(self)    # Participants and their data.
+        self._open_transport()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if self.session_key:
+                self.close()
+        finally:
+            self._close_transport()
+
+    def _open_transport(self):
+        """
+        Create the pooled HTTP session, if it is not already open.
+        """
+        if self.http is not None:
+            return
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+            max_retries=self.max_retries)
+        http = requests.Session()
+        http.mount("http://", adapter)
+        http.mount("https://", adapter)
+        self.http = http
+
+    def _close_transport(self):
+        """
+        Close the pooled HTTP session and its sockets.
+        """
+        if self.http is not None:
+            self.http.close()
+            self.http = None
 
     def open(self, password):
         """
@@ -24,23 +161,72 @@ class LimeSurvey(object):
         :param password: LimeSurvey password to authenticate with.
         :type password: String
         """
+        self._open_transport()
         method = "get_session_key"
         params = OrderedDict([
             ("username", self.username),
             ("password", password)
         ])
-        response = self.query(method=method, params=params)
-        response_type = type(response)
-
-        if response_type is dict and "status" in response:
-            status = response["status"]
-            error_messages = ["Invalid user name or password"]
-            for message in error_messages:
-                if status == message:
-                    raise LimeSurveyError(method, status)
-        else:
-            assert response_type is str
-        self.session_key = response
+        error_messages = ["Invalid user name or password"]
+        check = partial(
+            check_response, method, error_messages=error_messages,
+            response_type=str)
+        self.session_key = self.call(method=method, params=params, check=check)
+        if self.renew_session:
+            self._password = password
+
+    def _renewable(self, method, params, result):
+        """
+        True if the result says the session key in params has expired, and
+        the session can be renewed to send the call again.
+        """
+        return (self._password is not None and is_invalid_session(result) and
+                "sSessionKey" in params and method != "release_session_key")
+
+    def _renew(self, params):
+        """
+        Open a new session, unless another thread already replaced the
+        expired session key in params, and put the new key in params.
+        """
+        with self._renew_lock:
+            if self.session_key == params["sSessionKey"]:
+                self.open(password=self._password)
+        params["sSessionKey"] = self.session_key
+
+    def session_pool(self, password, size=4):
+        """
+        Open several sessions, to hand out to concurrent workers.
+
+        The server handles some work one request at a time per session, so
+        workers with their own session can get more done at once. Each
+        session is a client sharing this client's connections and settings.
+
+        with api.session_pool(password, size=4) as pool:
+            with pool.session() as client:
+                client.token.list_participants(survey_id)
+
+        Parameters
+        :param password: LimeSurvey password to authenticate with.
+        :type password: String
+        :param size: Number of sessions to open.
+        :type size: Integer
+
+        :return: _SessionPool, which releases the session keys on close().
+        """
+        return _SessionPool(self, password, size)
+
+    def _clone(self):
+        """
+        Return a client sharing this one's transport and settings, with its
+        own session key.
+        """
+        clone = copy.copy(self)
+        clone.session_key = None
+        clone._renew_lock = threading.Lock()
+        clone._local = threading.local()
+        clone.survey = _SyncSurvey(clone)
+        clone.token = _SyncToken(clone)
+        return clone
 
     def query(self, method, params):
         """
@@ -62,54 +248,488 @@ class LimeSurvey(object):
         :raise: LimeSurveyError if the API returns an error (either http error
             or error message in body)
         """
+        return self._traced(method, params, partial(
+            self._query, method, params))
+
+    def _query(self, method, params):
         if not self.session_key and not method == "get_session_key":
             raise LimeSurveyError(method, "No session open", params)
 
+        result = self._coalesced_send(method, params)
+        if self._renewable(method, params, result):
+            self._renew(params)
+            result = self._coalesced_send(method, params)
+        return result
+
+    def _coalesced_send(self, method, params):
+        if self.single_flight is not None and method in READ_METHODS:
+            return self.single_flight.do(
+                cache_key(method, params), partial(self._send, method, params))
+        return self._send(method, params)
+
+    def _send(self, method, params):
+        """
+        Send a query to the API, and return the result.
+        """
+        trace = self._trace()
+
         # 1. Prepare the request data
-        data = OrderedDict([
-            ("method", method),
-            ("params", params),
-            ("id", 1)  # Possibly a request id for parallel use cases.
-        ])
-        data_json = json.dumps(data)
+        started = trace and trace.begin("serialize")
+        data_json = encode_request(method, params, codec=self.codec)
+        self._local.request_bytes = len(data_json)
+        if trace:
+            trace.end("serialize", started)
+            self._fire(trace, "after_serialize", data_json)
 
         # 2. Query the API
-        response = requests.post(
-            self.url, headers=self.headers, data=data_json)
+        started = trace and trace.begin("network")
+        response = self._post(
+            method, data_json, idempotent=method in READ_METHODS)
+        if trace:
+            trace.end("network", started)
+            self._fire(trace, "after_response", response)
+
+        # 3. Read the result
+        started = trace and trace.begin("parse")
+        response_data = self.codec.loads(response.content)
+        result = get_result(
+            method, response_data, response.status_code, response.content)
+        if trace:
+            trace.end("parse", started)
+            self._fire(trace, "after_parse", result)
+        return result
 
-        if not response.ok:
-            raise LimeSurveyError(
-                method, "Not response.ok", response.status_code,
-                response.content)
+    def last_request_bytes(self):
+        """
+        Return the size of the last request body this thread sent, as
+        encoded by the codec, or 0 if it has sent none.
+        """
+        return getattr(self._local, "request_bytes", 0)
 
-        if not 0 < len(response.content):
-            raise LimeSurveyError(
-                method, "Not 0 < len(response.content)",
-                response.status_code, response.content)
+    def _trace(self):
+        """Return the CallTrace of the call in progress, if traced."""
+        return getattr(self._local, "trace", None) if self.hooks else None
 
-        response_data = response.json()
+    def _fire(self, trace, event, *args):
+        for hook in self.hooks:
+            getattr(hook, event)(trace, *args)
 
+    def _traced(self, method, params, function):
+        """
+        Run function() as a call traced by the hooks, unless it is part of a
+        call to the same method that is already traced.
+        """
+        current = getattr(self._local, "trace", None)
+        if not self.hooks or (
+                current is not None and current.method == method):
+            return function()
+        trace = CallTrace(method, params)
+        self._local.trace = trace
         try:
-            return_value = response_data.get("result")
-        except KeyError:
-            raise LimeSurveyError(
-                method, "Key 'result' not in response json",
-                response.status_code, response.content)
+            self._fire(trace, "before_request")
+            result = function()
+        except Exception as e:
+            self._fire(trace, "on_error", e)
+            raise
+        finally:
+            self._local.trace = current
+        self._fire(trace, "after_call", result)
+        return result
 
-        return return_value
+    def query_stream(self, method, params):
+        """
+        Query the LimeSurvey API, without reading the response body.
+
+        For large results, which the caller reads in chunks with
+        response.iter_content(), then closes with response.close().
+
+        Parameters
+        :param method: Name of API method to call.
+        :type method: String
+        :param params: Parameters to the specified API call.
+        :type params: OrderedDict
+
+        Return
+        :return: requests.Response
+        :raise: requests.ConnectionError
+        :raise: LimeSurveyError if the response is an http error.
+        """
+        if not self.session_key and not method == "get_session_key":
+            raise LimeSurveyError(method, "No session open", params)
+
+        data_json = encode_request(method, params, codec=self.codec)
+        return self._post(
+            method, data_json, idempotent=method in READ_METHODS, stream=True)
+
+    def read_stream(self, method, params, parse, chunk_size=65536):
+        """
+        Query the LimeSurvey API with query_stream(), and parse the response
+        as it is read.
+
+        If the result says the session key has expired, the session is
+        renewed and the query sent again, as with query().
+
+        Parameters
+        :param method: Name of API method to call.
+        :type method: String
+        :param params: Parameters to the specified API call.
+        :type params: OrderedDict
+        :param parse: Function called with (method, chunks, status_code),
+          returning a tuple of (parsed value, result or None), where the
+          result is returned if it could not be streamed, e.g. an error
+          status. Like iter_result_items or write_base64_result.
+        :type parse: Callable
+        :param chunk_size: Bytes to read from the response at a time.
+        :type chunk_size: Integer
+
+        Return
+        :return: tuple of (requests.Response, parsed value, result or None).
+          Close the response once done with the parsed value.
+        :raise: requests.ConnectionError
+        :raise: LimeSurveyError if the response is an http error.
+        """
+        renewed = False
+        while True:
+            response = self.query_stream(method=method, params=params)
+            try:
+                value, result = parse(
+                    method, response.iter_content(chunk_size),
+                    response.status_code)
+            except BaseException:
+                response.close()
+                raise
+            if renewed or not self._renewable(method, params, result):
+                return response, value, result
+            response.close()
+            self._renew(params)
+            renewed = True
+
+    def _post(self, method, data_json, idempotent=False, stream=False):
+        """
+        Send serialized request data to the API, and check the HTTP response.
+
+        Failed requests are sent again as allowed by the retry policy.
+
+        Parameters
+        :param method: Name of API method(s) being called, for errors.
+        :type method: String
+        :param data_json: Request body.
+        :type data_json: Bytes
+        :param idempotent: True if the request only reads data.
+        :type idempotent: Bool
+        :param stream: If True, don't read the body of a successful response.
+        :type stream: Bool
+
+        Return
+        :return: requests.Response
+        :raise: requests.RequestException
+        :raise: CircuitOpenError if the circuit breaker is open.
+        :raise: LimeSurveyError if the response is an http error or empty.
+        """
+        self._open_transport()
+        throttle = self._throttle_for(method)
+        attempts = [0]
+
+        def send(timeout):
+            attempts[0] += 1
+            if attempts[0] > 1:
+                self.call_metrics.record_retry(method)
+            if self.breaker is None:
+                return throttled_send(timeout)
+            probe = self.breaker.before(method)
+            try:
+                response = throttled_send(timeout)
+            except Exception as e:
+                self.breaker.record(e, probe)
+                raise
+            self.breaker.record(probe=probe)
+            return response
+
+        def throttled_send(timeout):
+            if throttle is None:
+                return self._send_http(method, data_json, timeout, stream)
+            if not stream:
+                with throttle.slot():
+                    return self._send_http(
+                        method, data_json, timeout, stream)
+            # A streamed body is read after this returns, so the slot is
+            # only freed when the response is closed.
+            release = throttle.take()
+            try:
+                response = self._send_http(method, data_json, timeout, stream)
+            except BaseException:
+                release(error=True)
+                raise
+            close = response.close
+
+            def close_and_release():
+                try:
+                    close()
+                finally:
+                    release()
+            response.close = close_and_release
+            return response
+
+        started = time.perf_counter()
+        try:
+            if self.retry is None:
+                response = send(self.timeout)
+            else:
+                response = self.retry.run(send, self.timeout, idempotent)
+        except Exception as e:
+            self.call_metrics.record_call(
+                method, time.perf_counter() - started, len(data_json), 0,
+                error=e)
+            raise
+        if stream:
+            response_bytes = int(response.headers.get("content-length", 0))
+        else:
+            response_bytes = len(response.content)
+        self.call_metrics.record_call(
+            method, time.perf_counter() - started, len(data_json),
+            response_bytes)
+        return response
+
+    def _send_http(self, method, data_json, timeout, stream):
+        """
+        Send one HTTP request for _post, and check the response.
+        """
+        response = self.http.post(
+            self.url, headers=self.headers, data=data_json,
+            timeout=timeout, stream=stream)
+        if not stream:
+            check_http_response(
+                method, response.status_code, response.content)
+        elif not response.ok:
+            try:
+                check_http_response(
+                    method, response.status_code, response.content)
+            finally:
+                response.close()
+        return response
+
+    def _throttle_for(self, method):
+        """
+        Return the Throttle for requests of the API method(s), or None.
+        """
+        if type(self.throttle) is not dict:
+            return self.throttle
+        return self.throttle.get(
+            method_class(method), self.throttle.get("default"))
+
+    def call(self, method, params, check):
+        """
+        Query the API, and check the result before returning it.
+
+        This is the entry point used by the _Survey and _Token methods.
+        Survey metadata is served from the cache if there is one, participant
+        properties of mirrored surveys are looked up locally, and each
+        listener is told about successful calls.
+
+        Parameters
+        :param method: Name of API method to call.
+        :type method: String
+        :param params: Parameters to the specified API call.
+        :type params: OrderedDict
+        :param check: Function that validates and returns the result.
+        :type check: Callable
+        """
+        return self._traced(method, params, partial(
+            self._checked_call, method, params, check))
+
+    def _checked_call(self, method, params, check):
+        result = self._cached(method, params)
+        if result is not MISSING:
+            return result
+        response = self._mirrored(method, params)
+        if response is MISSING:
+            response = self.query(method=method, params=params)
+        trace = self._trace()
+        started = trace and trace.begin("check")
+        try:
+            result = check(response)
+        except (LimeSurveyError, AssertionError) as e:
+            self.call_metrics.record_error(method, error_status(e))
+            raise
+        if trace:
+            trace.end("check", started)
+        self._after_call(method, params, result)
+        return result
+
+    def _cached(self, method, params):
+        """Return the cached result of the call, or MISSING."""
+        if self.cache is None or method not in CACHED_METHODS:
+            return MISSING
+        return self.cache.get(method, params, [self.url, self.username])
+
+    def _mirrored(self, method, params):
+        """Return the response of a mirror to the call, or MISSING."""
+        if method != "get_participant_properties":
+            return MISSING
+        mirror = self.mirrors.get(str(params["iSurveyID"]))
+        if mirror is None:
+            return MISSING
+        return mirror.lookup(
+            params["aTokenQueryProperties"], params["aTokenProperties"])
+
+    def _after_call(self, method, params, result):
+        """
+        Cache the checked result of a call, or invalidate the results it
+        affects, and tell the listeners about it.
+        """
+        if self.cache is not None:
+            if method in CACHED_METHODS:
+                self.cache.set(
+                    method, params, result, [self.url, self.username])
+            else:
+                self.cache.after_call(method, params, result)
+        for listener in self.listeners:
+            listener(method, params, result)
+
+    def batch(self, size=100):
+        """
+        Collect calls, and send them as JSON-RPC batches.
+
+        Methods on the survey and token attributes of the batch return a
+        concurrent.futures.Future instead of the result. The calls are sent
+        when the batch is flushed, which happens on leaving the with block.
+
+        with api.batch() as batch:
+            futures = [batch.token.get_participant_properties(sid, tid)
+                       for tid in token_ids]
+        properties = [f.result() for f in futures]
+
+        Parameters
+        :param size: Maximum number of calls per HTTP request.
+        :type size: Integer
+        """
+        return _Batch(self, size=size)
+
+    def metrics(self):
+        """
+        Return a snapshot of the client's call metrics, by method: counts
+        of calls, retries and errors by status, request and response bytes,
+        and a latency histogram.
+
+        Render it for Prometheus with limesurveyrc2api.metrics
+        .render_prometheus, or use metrics_text().
+        """
+        return self.call_metrics.snapshot()
+
+    def metrics_text(self):
+        """Return the client's call metrics in Prometheus text format."""
+        return render_prometheus(self.call_metrics.snapshot())
+
+    def query_batch(self, calls):
+        """
+        Query the LimeSurvey API with several calls in one HTTP request.
+
+        The calls are sent as a JSON-RPC batch. If the server does not accept
+        batches, the calls are sent one by one with query() instead, and
+        later batches go the same way.
+
+        Parameters
+        :param calls: Method names and parameters to call.
+        :type calls: List[Tuple[String, OrderedDict]]
+
+        Return
+        :return: for each call, in order, the result of the API call, or the
+            LimeSurveyError raised for it.
+        :raise: requests.ConnectionError
+        :raise: LimeSurveyError if the http request fails.
+        """
+        if self.batch_supported:
+            results = self._query_batch(calls)
+            if results is not None:
+                return results
+            self.batch_supported = False
+
+        results = []
+        for method, params in calls:
+            try:
+                results.append(self.query(method=method, params=params))
+            except LimeSurveyError as e:
+                results.append(e)
+        return results
+
+    def _query_batch(self, calls, renew=True):
+        """
+        Send the calls as a JSON-RPC batch.
+
+        Calls that fail because the session key has expired are sent again,
+        in another batch, once the session is renewed.
+
+        Return
+        :return: results as per query_batch, or None if the server did not
+            return a batch response.
+        """
+        results = [None] * len(calls)
+        data = []
+        for request_id, (method, params) in enumerate(calls):
+            if not self.session_key and not method == "get_session_key":
+                results[request_id] = LimeSurveyError(
+                    method, "No session open", params)
+                continue
+            data.append(OrderedDict([
+                ("method", method),
+                ("params", params),
+                ("id", request_id)
+            ]))
+        if not data:
+            return results
+        methods = ",".join(sorted(set(x["method"] for x in data)))
+        idempotent = all(x["method"] in READ_METHODS for x in data)
+        response = self._post(
+            methods, self.codec.dumps(data), idempotent=idempotent)
+
+        try:
+            response_data = self.codec.loads(response.content)
+        except ValueError:
+            return None
+        if type(response_data) is not list:
+            return None
+
+        responses = {}
+        for item in response_data:
+            if type(item) is dict and "id" in item:
+                responses[item["id"]] = item
+        for item in data:
+            request_id = item["id"]
+            if request_id in responses:
+                results[request_id] = responses[request_id].get("result")
+            else:
+                results[request_id] = LimeSurveyError(
+                    item["method"], "No response for batch id", request_id,
+                    response.status_code, response.content)
+
+        expired = [i for i, (method, params) in enumerate(calls)
+                   if renew and self._renewable(method, params, results[i])]
+        if expired:
+            for i in expired:
+                self._renew(calls[i][1])
+            retried = self._query_batch(
+                [calls[i] for i in expired], renew=False)
+            if retried is not None:
+                for i, result in zip(expired, retried):
+                    results[i] = result
+        return results
 
     def close(self):
         """
-        Close an open session in LimeSurvey.
+        Close an open session in LimeSurvey, and the HTTP connections with it.
         """
         method = "release_session_key"
         params = OrderedDict([
             ("sSessionKey", self.session_key)
         ])
-        response = self.query(method=method, params=params)
+        try:
+            response = self.query(method=method, params=params)
+        finally:
+            self._close_transport()
 
         if response == "OK":
             self.session_key = None
+            self._password = None
         else:
             raise LimeSurveyError(method, "Did not receive 'OK' response")
 
@@ -0,0 +1,187 @@
+import bisect
+import copy
+import threading
+from collections import OrderedDict
+from limesurveyrc2api.exceptions import LimeSurveyError
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0, float("inf"))
+
+
+def error_status(error):
+    """
+    Short description of an error, to count errors by.
+
+    The status of API errors (e.g. "No permission"), "HTTP 502" for http
+    errors, or the type of other errors (e.g. "ConnectTimeout").
+    """
+    if isinstance(error, LimeSurveyError) and len(error.args) > 1:
+        if error.args[1] == "Not response.ok":
+            return "HTTP %s" % error.args[2]
+        return str(error.args[1])
+    return type(error).__name__
+
+
+def _new_method_metrics(buckets):
+    return OrderedDict([
+        ("calls", 0),
+        ("errors", OrderedDict()),
+        ("retries", 0),
+        ("request_bytes", 0),
+        ("response_bytes", 0),
+        ("latency_buckets", [0] * len(buckets)),
+        ("latency_sum", 0.0),
+    ])
+
+
+class Metrics(object):
+    """
+    Counts and timings of the API calls made by a client, per method.
+
+    Each client records into its own Metrics, unless given one to share.
+    Calls answered from a cache or mirror are not counted, as they make no
+    request. Batches are counted under their comma separated method names.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Parameters
+        :param buckets: Upper bounds of the latency histogram buckets, in
+          seconds, ascending and ending with infinity.
+        :type buckets: Tuple[Float]
+        """
+        self.buckets = tuple(buckets)
+        self.methods = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _method(self, method):
+        metrics = self.methods.get(method)
+        if metrics is None:
+            metrics = self.methods[method] = _new_method_metrics(self.buckets)
+        return metrics
+
+    def record_call(self, method, seconds, request_bytes, response_bytes,
+                    error=None):
+        """
+        Record a request, including any retries of it.
+
+        Parameters
+        :param method: Name of API method(s) called.
+        :type method: String
+        :param seconds: Time taken, from sending to receiving the response.
+        :type seconds: Float
+        :param request_bytes: Size of the request body.
+        :type request_bytes: Integer
+        :param response_bytes: Size of the response body.
+        :type response_bytes: Integer
+        :param error: (optional) Error the request failed with.
+        :type error: Exception
+        """
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            metrics = self._method(method)
+            metrics["calls"] += 1
+            metrics["request_bytes"] += request_bytes
+            metrics["response_bytes"] += response_bytes
+            metrics["latency_buckets"][min(index, len(self.buckets) - 1)] += 1
+            metrics["latency_sum"] += seconds
+            if error is not None:
+                self._add_error(metrics, error_status(error))
+
+    def record_error(self, method, status):
+        """Record an error status returned by the API method."""
+        with self._lock:
+            self._add_error(self._method(method), status)
+
+    def record_retry(self, method):
+        """Record a retry of a request."""
+        with self._lock:
+            self._method(method)["retries"] += 1
+
+    def _add_error(self, metrics, status):
+        metrics["errors"][status] = metrics["errors"].get(status, 0) + 1
+
+    def snapshot(self):
+        """
+        Return a copy of the metrics, as a dict by method name.
+
+        The latency histogram is cumulative, as a list of (upper bound,
+        number of calls taking at most that long) tuples.
+        """
+        with self._lock:
+            methods = copy.deepcopy(self.methods)
+        for metrics in methods.values():
+            counts = metrics.pop("latency_buckets")
+            total = 0
+            histogram = []
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                histogram.append((bound, total))
+            metrics["latency_histogram"] = histogram
+        return methods
+
+    def reset(self):
+        with self._lock:
+            self.methods = OrderedDict()
+
+
+def _label(value):
+    value = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"')
+
+
+def _bound(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+def render_prometheus(snapshot, prefix="limesurvey_rpc"):
+    """
+    Render a Metrics snapshot in the Prometheus text exposition format.
+
+    Parameters
+    :param snapshot: Result of Metrics.snapshot().
+    :type snapshot: Dict
+    :param prefix: Prefix of the metric names.
+    :type prefix: String
+
+    Return
+    :return: String
+    """
+    lines = []
+
+    def header(name, kind, text):
+        lines.append("# HELP %s_%s %s" % (prefix, name, text))
+        lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+
+    counters = [
+        ("calls_total", "calls", "Requests made, by method."),
+        ("retries_total", "retries", "Retries of requests, by method."),
+        ("request_bytes_total", "request_bytes",
+         "Bytes of request bodies sent, by method."),
+        ("response_bytes_total", "response_bytes",
+         "Bytes of response bodies received, by method."),
+    ]
+    for name, key, text in counters:
+        header(name, "counter", text)
+        for method, metrics in snapshot.items():
+            lines.append('%s_%s{method="%s"} %s' % (
+                prefix, name, _label(method), metrics[key]))
+
+    header("errors_total", "counter", "Errors, by method and status.")
+    for method, metrics in snapshot.items():
+        for status, count in metrics["errors"].items():
+            lines.append('%s_errors_total{method="%s",status="%s"} %s' % (
+                prefix, _label(method), _label(status), count))
+
+    header("latency_seconds", "histogram", "Latency of requests, by method.")
+    for method, metrics in snapshot.items():
+        for bound, count in metrics["latency_histogram"]:
+            lines.append(
+                '%s_latency_seconds_bucket{method="%s",le="%s"} %s' % (
+                    prefix, _label(method), _bound(bound), count))
+        lines.append('%s_latency_seconds_sum{method="%s"} %r' % (
+            prefix, _label(method), metrics["latency_sum"]))
+        lines.append('%s_latency_seconds_count{method="%s"} %s' % (
+            prefix, _label(method), metrics["calls"]))
+    return "\n".join(lines) + "\n"
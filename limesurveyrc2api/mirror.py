@@ -0,0 +1,220 @@
+import json
+import sqlite3
+import threading
+import time
+from limesurveyrc2api._paging import flatten_participant
+from limesurveyrc2api.cache import READ_PREFIXES, call_survey_id
+
+# Token properties to fetch with list_participants, besides tid, token and
+# participant_info (firstname, lastname, email).
+TOKEN_ATTRIBUTES = [
+    "blacklisted", "completed", "emailstatus", "language", "mpid",
+    "participant_id", "remindercount", "remindersent", "sent", "usesleft",
+    "validfrom", "validuntil"]
+
+NO_RESULTS = "Error: No results were found based on your attributes."
+MORE_THAN_ONE = "Error: More than 1 result was found based on your attributes."
+
+
+def _matches(row, query):
+    for key, value in query.items():
+        if key not in row or str(row[key]) != str(value):
+            return False
+    return True
+
+
+class _MemoryIndex(object):
+    """Participants held in memory, with hash indexes on tid/token/email."""
+
+    def __init__(self):
+        self.by_tid = {}
+        self.by_token = {}
+        self.by_email = {}
+
+    def replace(self, rows):
+        self.by_tid, self.by_token, self.by_email = {}, {}, {}
+        for row in rows:
+            self.by_tid[str(row["tid"])] = row
+            self.by_token[row.get("token")] = row
+            self.by_email.setdefault(row.get("email"), []).append(row)
+
+    def remove(self, token_ids):
+        for token_id in token_ids:
+            row = self.by_tid.pop(str(token_id), None)
+            if row is None:
+                continue
+            self.by_token.pop(row.get("token"), None)
+            rows = self.by_email.get(row.get("email"), [])
+            rows[:] = [x for x in rows if x is not row]
+
+    def find(self, query):
+        if "tid" in query:
+            candidates = [self.by_tid.get(str(query["tid"]))]
+        elif "token" in query:
+            candidates = [self.by_token.get(query["token"])]
+        elif "email" in query:
+            candidates = self.by_email.get(query["email"], [])
+        else:
+            candidates = self.by_tid.values()
+        return [x for x in candidates if x is not None and _matches(x, query)]
+
+    def __len__(self):
+        return len(self.by_tid)
+
+
+class _SqliteIndex(object):
+    """Participants held in an SQLite file, indexed on tid/token/email."""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS participants ("
+            "tid TEXT PRIMARY KEY, token TEXT, email TEXT, data TEXT)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS participants_token "
+            "ON participants (token)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS participants_email "
+            "ON participants (email)")
+        self.connection.commit()
+
+    def replace(self, rows):
+        with self.connection:
+            self.connection.execute("DELETE FROM participants")
+            self.connection.executemany(
+                "INSERT INTO participants VALUES (?, ?, ?, ?)",
+                ((str(x["tid"]), x.get("token"), x.get("email"),
+                  json.dumps(x)) for x in rows))
+
+    def remove(self, token_ids):
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM participants WHERE tid = ?",
+                ((str(x),) for x in token_ids))
+
+    def find(self, query):
+        for column in ("tid", "token", "email"):
+            if column in query:
+                cursor = self.connection.execute(
+                    "SELECT data FROM participants WHERE %s = ?" % column,
+                    (str(query[column]),))
+                break
+        else:
+            cursor = self.connection.execute("SELECT data FROM participants")
+        rows = (json.loads(x[0]) for x in cursor)
+        return [x for x in rows if _matches(x, query)]
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM participants").fetchone()[0]
+
+
+class ParticipantMirror(object):
+    """
+    A local copy of a survey's participants, for get_participant_properties.
+
+    Once created with _SyncToken.mirror_participants, the client answers
+    get_participant_properties calls for the survey from the mirror, with
+    the same results and errors as the server. The mirror is rebuilt from
+    list_participants when it is older than max_age seconds, and after any
+    other write to the survey through the same client, such as
+    add_participants or invite_participants. Participants deleted with
+    delete_participants are removed from it.
+    """
+
+    def __init__(self, api, survey_id, max_age=300, path=None,
+                 attributes=None, page_size=1000):
+        """
+        Parameters
+        :param api: Client to build the mirror with, and answer lookups for.
+        :type api: LimeSurvey
+        :param survey_id: ID of survey to mirror participants of.
+        :type survey_id: Integer
+        :param max_age: Seconds after which the mirror is rebuilt.
+        :type max_age: Float
+        :param path: (optional) Path of an SQLite file to keep the mirror
+          in, instead of memory.
+        :type path: String
+        :param attributes: (optional) Token attributes to mirror, by default
+          the standard ones. Add "attribute_1" etc. for custom attributes.
+        :type attributes: List[String]
+        :param page_size: Number of participants to fetch per request.
+        :type page_size: Integer
+        """
+        self.api = api
+        self.survey_id = survey_id
+        self.max_age = max_age
+        self.attributes = attributes or TOKEN_ATTRIBUTES
+        self.page_size = page_size
+        self.index = _MemoryIndex() if path is None else _SqliteIndex(path)
+        self.built_at = None
+        self._lock = threading.RLock()
+
+    @property
+    def is_stale(self):
+        return (self.built_at is None or
+                time.monotonic() - self.built_at > self.max_age)
+
+    def attach(self):
+        """Answer the client's lookups for the survey from the mirror."""
+        self.api.mirrors[str(self.survey_id)] = self
+        if self.after_call not in self.api.listeners:
+            self.api.listeners.append(self.after_call)
+
+    def detach(self):
+        """Stop answering the client's lookups from the mirror."""
+        if self.api.mirrors.get(str(self.survey_id)) is self:
+            del self.api.mirrors[str(self.survey_id)]
+        if self.after_call in self.api.listeners:
+            self.api.listeners.remove(self.after_call)
+
+    def invalidate(self):
+        """Mark the mirror to be rebuilt on the next lookup."""
+        self.built_at = None
+
+    def refresh(self):
+        """Rebuild the mirror from list_participants."""
+        with self._lock:
+            pager = self.api.token.iter_participants(
+                self.survey_id, page_size=self.page_size,
+                attributes=self.attributes)
+            self.index.replace(flatten_participant(x) for x in pager)
+            self.built_at = time.monotonic()
+
+    def lookup(self, token_query_properties, token_properties=None):
+        """
+        Find a participant, like get_participant_properties on the server.
+
+        Return
+        :return: dict of the participant's properties (only those in
+          token_properties, if given), or a dict with an error "status".
+          The dict is the caller's own copy.
+        """
+        with self._lock:
+            if self.is_stale:
+                self.refresh()
+            rows = self.index.find(token_query_properties)
+        if not rows:
+            return {"status": NO_RESULTS}
+        if len(rows) > 1:
+            return {"status": MORE_THAN_ONE}
+        row = rows[0]
+        if token_properties:
+            return dict((x, row[x]) for x in token_properties if x in row)
+        return dict(row)
+
+    def after_call(self, method, params, result):
+        """
+        Keep the mirror up to date with writes made through the client.
+        """
+        if call_survey_id(method, params) != str(self.survey_id):
+            return
+        if method == "delete_participants" and type(result) is dict:
+            with self._lock:
+                self.index.remove(
+                    x for x, y in result.items() if y == "Deleted")
+        elif not method.startswith(READ_PREFIXES):
+            self.invalidate()
+
+    def __len__(self):
+        return len(self.index)
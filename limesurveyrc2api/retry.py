@@ -0,0 +1,133 @@
+import random
+import threading
+import time
+import requests
+from limesurveyrc2api.exceptions import LimeSurveyError
+
+# HTTP statuses of errors which are usually transient, e.g. a 502 from the
+# PHP-FPM tier while it is overloaded or restarting.
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+
+def _status_code(error):
+    """HTTP status of a LimeSurveyError raised for an http error, or None."""
+    if error.args[1:2] == ("Not response.ok",):
+        return error.args[2]
+    return None
+
+
+def _attempt_timeout(timeout, remaining):
+    """
+    Cap the (connect, read) timeout of one attempt to the remaining time.
+    """
+    if remaining is None:
+        return timeout
+    remaining = max(remaining, 0.001)
+    if timeout is None:
+        return remaining
+    if type(timeout) is tuple:
+        return tuple(remaining if x is None else min(x, remaining)
+                     for x in timeout)
+    return min(timeout, remaining)
+
+
+class RetryPolicy(object):
+    """
+    When and how long to wait before sending a failed request again.
+
+    Pass to LimeSurvey(retry=...). Reads (methods in READ_METHODS) are
+    retried after connection errors, timeouts and the `statuses` http
+    errors. Writes are only retried if the connection could not be made, so
+    the server can't have run them, unless `retry_writes` is True.
+
+    The n-th retry waits a random time between 0 and backoff * 2 ** n
+    seconds (at most max_backoff), so that clients failing at the same time
+    spread out their retries. No retry is made that would end after the
+    deadline, counted from the first attempt, and the connect and read
+    timeouts of each attempt are cut to the time left, so an attempt that
+    gets no response fails at the deadline.
+
+    `retries` counts the retries made.
+    """
+
+    def __init__(self, attempts=4, backoff=0.5, max_backoff=10.0,
+                 deadline=None, statuses=RETRY_STATUSES, retry_writes=False):
+        """
+        Parameters
+        :param attempts: Maximum number of attempts per request, including
+          the first.
+        :type attempts: Integer
+        :param backoff: Seconds to wait before the first retry, at most.
+        :type backoff: Float
+        :param max_backoff: Maximum seconds to wait before any retry.
+        :type max_backoff: Float
+        :param deadline: (optional) Seconds all the attempts must finish in.
+        :type deadline: Float
+        :param statuses: HTTP statuses to retry reads after.
+        :type statuses: Set[Integer]
+        :param retry_writes: If True, retry writes like reads. Only safe if
+          running a write twice is harmless.
+        :type retry_writes: Bool
+        """
+        if attempts < 1:
+            raise ValueError("Attempts must be at least 1.")
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.statuses = frozenset(statuses)
+        self.retry_writes = retry_writes
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def is_retryable(self, error, idempotent):
+        """
+        True if a request that failed with the error can be sent again.
+        """
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        if not (idempotent or self.retry_writes):
+            return False
+        if isinstance(error, LimeSurveyError):
+            return _status_code(error) in self.statuses
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+    def delay(self, retry):
+        """Seconds to wait before the retry, numbered from 0."""
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+    def run(self, send, timeout, idempotent):
+        """
+        Call send(timeout) until it succeeds, or can't be retried.
+
+        Parameters
+        :param send: Function sending the request, taking the timeout.
+        :type send: Callable
+        :param timeout: Timeout per attempt, as for requests.
+        :type timeout: Float or Tuple[Float, Float]
+        :param idempotent: True if the request only reads data.
+        :type idempotent: Bool
+
+        Return
+        :return: result of send.
+        :raise: the error of the last attempt.
+        """
+        started = time.monotonic()
+        end = None if self.deadline is None else started + self.deadline
+        attempt = 0
+        while True:
+            remaining = None if end is None else end - time.monotonic()
+            try:
+                return send(_attempt_timeout(timeout, remaining))
+            except (LimeSurveyError, requests.RequestException) as e:
+                attempt += 1
+                if (attempt >= self.attempts or
+                        not self.is_retryable(e, idempotent)):
+                    raise
+                delay = self.delay(attempt - 1)
+                if end is not None and time.monotonic() + delay >= end:
+                    raise
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
@@ -0,0 +1,217 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Classes of methods, to throttle separately. Exports are long-running and
+# heavy on the server, token lookups short and frequent.
+EXPORT_METHODS = frozenset([
+    "export_responses", "export_responses_by_token", "export_statistics",
+    "export_timeline"])
+TOKEN_METHODS = frozenset([
+    "add_participants", "delete_participants", "get_participant_properties",
+    "invite_participants", "list_participants", "remind_participants",
+    "set_participant_properties"])
+
+
+def method_class(method):
+    """
+    Class of an API method for throttling: "export", "token" or "default".
+
+    For a batch, given as comma separated method names, the class shared by
+    all of them, or "default".
+    """
+    classes = set()
+    for name in method.split(","):
+        if name in EXPORT_METHODS:
+            classes.add("export")
+        elif name in TOKEN_METHODS:
+            classes.add("token")
+        else:
+            classes.add("default")
+    return classes.pop() if len(classes) == 1 else "default"
+
+
+class TokenBucket(object):
+    """
+    Limits the rate of requests to `rate` per second, on average.
+
+    Up to `burst` requests can be made at once after a quiet period.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        Parameters
+        :param rate: Requests per second.
+        :type rate: Float
+        :param burst: Maximum requests to allow at once.
+        :type burst: Integer
+        """
+        if rate <= 0:
+            raise ValueError("Rate must be more than 0.")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a request may be made."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Take the token now, so later callers queue up behind this one.
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class AdaptiveConcurrency(object):
+    """
+    Limits the number of requests in flight, adapting the limit to the server.
+
+    The limit grows by about 1 for each limit's worth of requests that
+    succeed with normal latency while the limit is in use, and is cut by
+    `backoff` when a request fails, or takes more than `tolerance` times the
+    normal latency. Normal latency is a moving average of the latency of
+    healthy requests. Only one cut is made for the requests in flight when
+    the server got slow, so the limit is not cut to the minimum at once.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=64, tolerance=2.0,
+                 backoff=0.5, smoothing=0.1):
+        """
+        Parameters
+        :param initial: Starting limit.
+        :type initial: Integer
+        :param minimum: Lowest the limit can be cut to.
+        :type minimum: Integer
+        :param maximum: Highest the limit can grow to.
+        :type maximum: Integer
+        :param tolerance: Multiple of the normal latency above which a
+          request counts as a sign of an overloaded server.
+        :type tolerance: Float
+        :param backoff: Factor to cut the limit by.
+        :type backoff: Float
+        :param smoothing: Weight of each healthy request's latency in the
+          moving average.
+        :type smoothing: Float
+        """
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError("Need 1 <= minimum <= initial <= maximum.")
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.latency = None
+        self.in_flight = 0
+        self._cut_at = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait for a free slot, and take it.
+
+        Return
+        :return: time the request started, to pass to release().
+        """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started, error=False):
+        """
+        Free the slot of a finished request, and adapt the limit.
+
+        Parameters
+        :param started: Time returned by acquire().
+        :type started: Float
+        :param error: True if the request failed.
+        :type error: Bool
+        """
+        now = time.monotonic()
+        latency = now - started
+        with self._condition:
+            was_full = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            slow = (self.latency is not None and
+                    latency > self.latency * self.tolerance)
+            if error or slow:
+                if started >= self._cut_at:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._cut_at = now
+            else:
+                if self.latency is None:
+                    self.latency = latency
+                else:
+                    self.latency += self.smoothing * (latency - self.latency)
+                if was_full:
+                    self.limit = min(
+                        self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+
+class Throttle(object):
+    """
+    Rate and concurrency limits for a class of requests.
+
+    Pass to LimeSurvey(throttle=...), either one Throttle for all requests,
+    or a dict of them by method class (see method_class), where "default"
+    covers the classes not given.
+    """
+
+    def __init__(self, rate=None, burst=1, concurrency=None):
+        """
+        Parameters
+        :param rate: (optional) Maximum requests per second.
+        :type rate: Float
+        :param burst: Maximum requests to allow at once under the rate.
+        :type burst: Integer
+        :param concurrency: (optional) Limit of requests in flight.
+        :type concurrency: AdaptiveConcurrency
+        """
+        self.bucket = None if rate is None else TokenBucket(rate, burst)
+        self.concurrency = concurrency
+
+    def take(self):
+        """
+        Wait until a request may be made, and take a concurrency slot.
+
+        Return
+        :return: function to call when the request is over, with
+          error=True if it failed, to free the slot. Only the first call
+          frees it.
+        """
+        if self.bucket is not None:
+            self.bucket.acquire()
+        if self.concurrency is None:
+            return lambda error=False: None
+        concurrency = self.concurrency
+        started = concurrency.acquire()
+        lock = threading.Lock()
+        taken = [True]
+
+        def release(error=False):
+            with lock:
+                if not taken[0]:
+                    return
+                taken[0] = False
+            concurrency.release(started, error=error)
+        return release
+
+    @contextmanager
+    def slot(self):
+        """Wait until a request may be made, for the duration of the block."""
+        release = self.take()
+        try:
+            yield
+        except BaseException:
+            release(error=True)
+            raise
+        release()
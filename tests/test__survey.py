@@ -1,5 +1,12 @@
+import json
+import os
+import tempfile
+from base64 import b64decode
+from io import BytesIO
 from tests.test_limesurvey import TestBase
-from limesurveyrc2api.limesurvey import LimeSurveyError
+from limesurveyrc2api.incremental import ExportState
+from limesurveyrc2api.cache import MemoryCache
+from limesurveyrc2api.limesurvey import LimeSurvey, LimeSurveyError
 
 
 class TestSurveys(TestBase):
@@ -44,6 +51,66 @@ class TestSurveys(TestBase):
                 self.survey_id, document_type=extension)
             self.assertIs(type(result), str)
 
+    def test_export_responses_to_success(self):
+        """ Streaming an export should write the decoded export. """
+        expected = b64decode(self.api.survey.export_responses(
+            self.survey_id, document_type='csv'))
+        output = BytesIO()
+        written = self.api.survey.export_responses_to(
+            output, self.survey_id, document_type='csv', chunk_size=1024)
+        self.assertEqual(len(expected), written)
+        self.assertEqual(expected, output.getvalue())
+
+    def test_export_responses_to_failure(self):
+        """ Streaming an export with an error status should raise it. """
+        with self.assertRaises(LimeSurveyError) as ctx:
+            self.api.survey.export_responses_to(
+                BytesIO(), self.survey_id, document_type='csv',
+                language_code='not_a_language')
+        self.assertIn("Language code not found", ctx.exception.message)
+
+    def test_parallel_export_responses_success(self):
+        """ A parallel export should match a single export. """
+        for document_type in ['csv', 'json']:
+            expected = b64decode(self.api.survey.export_responses(
+                self.survey_id, document_type=document_type))
+            result = b64decode(self.api.survey.parallel_export_responses(
+                self.survey_id, document_type=document_type, workers=2,
+                partition_size=1))
+            if document_type == 'json':
+                expected, result = json.loads(expected), json.loads(result)
+            self.assertEqual(expected, result)
+
+    def test_parallel_export_responses_failure(self):
+        """ A parallel export of a format that can't be joined should fail. """
+        with self.assertRaises(ValueError):
+            self.api.survey.parallel_export_responses(
+                self.survey_id, document_type='pdf')
+
+    def test_export_responses_incremental_success(self):
+        """ A second incremental export should only return new responses. """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            state_path = os.path.join(temp_dir, 'state.json')
+            dataset_path = os.path.join(temp_dir, 'responses.jsonl')
+            first = self.api.survey.export_responses_incremental(
+                self.survey_id, ExportState(state_path), dataset=dataset_path)
+            self.assertTrue(first)
+            second = self.api.survey.export_responses_incremental(
+                self.survey_id, ExportState(state_path), dataset=dataset_path)
+            self.assertEqual([], second)
+            with open(dataset_path) as f:
+                self.assertEqual(len(first), len(f.readlines()))
+
+    def test_export_responses_frame_success(self):
+        """ A frame export should have a typed column per exported field. """
+        expected = json.loads(b64decode(self.api.survey.export_responses(
+            self.survey_id, document_type='json')))
+        result = self.api.survey.export_responses_frame(
+            self.survey_id, kind='python')
+        self.assertEqual(len(expected['responses']), len(result['id']))
+        for response_id in result['id']:
+            self.assertIs(int, type(response_id))
+
     # TODO: add tests for other parameters of export_responses
 
     def test_import_survey_success_lss(self):
@@ -112,3 +179,35 @@ class TestSurveys(TestBase):
         with self.assertRaises(LimeSurveyError) as ctx:
             self.api.survey.list_questions(self.survey_id_invalid)
         self.assertIn("Error: Invalid survey ID", ctx.exception.message)
+
+
+class TestSurveysCached(TestBase):
+
+    def setUp(self):
+        self.cache = MemoryCache(ttl=60)
+        self.cached_api = LimeSurvey(
+            url=self.url, username=self.username, cache=self.cache)
+        self.cached_api.open(password=self.password)
+
+    def tearDown(self):
+        self.cached_api.close()
+
+    def test_list_questions_cached_success(self):
+        """Repeated metadata calls should be answered from the cache."""
+        first = self.cached_api.survey.list_questions(self.survey_id)
+        second = self.cached_api.survey.list_questions(self.survey_id)
+        self.assertEqual(first, second)
+        self.assertEqual((1, 1), (self.cache.misses, self.cache.hits))
+
+    def test_import_survey_invalidates_cache(self):
+        """Importing a survey should drop the cached survey list."""
+        self.cached_api.survey.list_surveys()
+        s = 'tests/fixtures/a_rather_interesting_questionnaire_for_testing.lss'
+        new_survey_id = self.cached_api.survey.import_survey(
+            s, new_name='cache_me')
+        try:
+            result = self.cached_api.survey.list_surveys()
+            self.assertIn(new_survey_id, [int(x['sid']) for x in result])
+            self.assertEqual(2, self.cache.misses)
+        finally:
+            self.cached_api.survey.delete_survey(new_survey_id)
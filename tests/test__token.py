@@ -54,6 +54,30 @@ class TestTokens(TestBase):
                 self.assertEqual(participant[key], token[key])
                 self.assertIsNotNone(token["token"])
 
+    def test_add_participants_bulk_success(self):
+        """Adding participants in chunks should map each row to its token."""
+        participants = self.get_participants(
+            "test_add_participants_bulk_success")
+        result = self.api.token.add_participants_bulk(
+            survey_id=self.survey_id, participant_data=iter(participants),
+            chunk_size=2, min_chunk_size=1)
+        self.token_ids = [x["tid"] for x in result.participants if x]
+        self.assertEqual({}, result.errors)
+        self.assertEqual([2, 1], result.chunk_sizes)
+        for token, participant in zip(result.participants, participants):
+            self.assertEqual(participant["email"], token["email"])
+            self.assertIsNotNone(token["token"])
+
+    def test_add_participants_bulk_survey_failure(self):
+        """A failed chunk should record an error for each of its rows."""
+        participants = self.get_participants(
+            "test_add_participants_bulk_survey_failure")
+        result = self.api.token.add_participants_bulk(
+            survey_id=self.survey_id_invalid, participant_data=participants)
+        self.assertEqual([None] * len(participants), result.participants)
+        self.assertEqual(len(participants), len(result.errors))
+        self.assertIn("Error: Invalid survey ID", result.errors[0].message)
+
     def test_delete_participants_success(self):
         """Deleting participants should return deleted token id list."""
         participants = self.get_participants(
@@ -68,6 +92,56 @@ class TestTokens(TestBase):
             self.assertIn(token_id, self.token_ids)
             self.assertEqual("Deleted", token_result)
 
+    def test_delete_participants_bulk_success(self):
+        """Deleting participants in chunks should merge the results."""
+        participants = self.get_participants(
+            "test_delete_participants_bulk_success")
+        added_tokens = self.api.token.add_participants(
+            survey_id=self.survey_id, participant_data=participants)
+        self.token_ids = [x["tid"] for x in added_tokens]
+
+        progress = []
+        deleted = self.api.token.delete_participants_bulk(
+            survey_id=self.survey_id, token_ids=self.token_ids,
+            chunk_size=2, progress=lambda *x: progress.append(x))
+        self.assertEqual(len(self.token_ids), deleted.succeeded)
+        for token_id in self.token_ids:
+            self.assertEqual("Deleted", deleted.results[token_id])
+        self.assertEqual((len(self.token_ids), 0, 0), progress[-1])
+
+    def test_sync_participants_success(self):
+        """Syncing should only add and delete the differing participants."""
+        participants = self.get_participants(
+            "test_sync_participants_success")
+        added_tokens = self.api.token.add_participants(
+            survey_id=self.survey_id, participant_data=participants)
+        self.token_ids = [x["tid"] for x in added_tokens]
+        current = [dict(x, tid=y["tid"])
+                   for x, y in zip(participants, added_tokens)]
+
+        desired = [dict(x) for x in participants[:2]]
+        desired[1]["firstname"] = "FN2-changed"
+        desired.append({"email": "t4@example.com", "firstname": "FN4",
+                        "lastname": "test_sync_participants_success"})
+        others = [x for x in self.api.token.list_participants(
+            survey_id=self.survey_id) if x["tid"] not in self.token_ids]
+        desired.extend(x["participant_info"] for x in others)
+
+        report = self.api.token.sync_participants(
+            survey_id=self.survey_id, desired_rows=desired, dry_run=True)
+        self.assertEqual(
+            sorted([current[1]["tid"], current[2]["tid"]]),
+            sorted(report.to_delete))
+        self.assertEqual([desired[1], desired[2]], report.to_add)
+        self.assertEqual(["t2@example.com"], report.changed)
+
+        report = self.api.token.sync_participants(
+            survey_id=self.survey_id, desired_rows=desired)
+        self.token_ids = [current[0]["tid"]] + [
+            x["tid"] for x in report.add_result.participants]
+        self.assertEqual(2, report.delete_result.succeeded)
+        self.assertEqual({}, report.add_result.errors)
+
     def test_get_participant_properties_duplicate_failure(self):
         """Querying on a property with >1 results should return an error."""
         participants = self.get_participants(
@@ -105,6 +179,22 @@ class TestTokens(TestBase):
         for token_id, email_info in message_statuses.items():
             self.assertEqual("OK", email_info.get("status"))
 
+    def test_invite_participants_bulk_success(self):
+        """Sending invites in chunks should relay all invites."""
+        participants = self.get_participants(
+            "test_invite_participants_bulk_success")
+        added_tokens = self.api.token.add_participants(
+            survey_id=self.survey_id, participant_data=participants)
+        self.token_ids = [x["tid"] for x in added_tokens]
+
+        with CapturingAiosmtpdServer() as cas:
+            result = self.api.token.invite_participants_bulk(
+                survey_id=self.survey_id, token_ids=self.token_ids,
+                chunk_size=2, workers=2)
+        self.assertEqual(len(participants), len(cas.messages))
+        self.assertEqual(len(participants), result.succeeded)
+        self.assertEqual({}, result.errors)
+
     def test_invite_participants_uninvited_failure(self):
         """Re-sending invites with uninvited_only should return an error."""
         participants = self.get_participants(
@@ -224,6 +314,48 @@ class TestTokensWithExisting(TestBase):
             survey_id=self.survey_id, token_id=token0["tid"])
         self.assertEqual(participant0["email"], token0_props["email"])
 
+    def test_get_participant_properties_batch_success(self):
+        """Batched property queries should resolve each future in order."""
+        with self.api.batch() as batch:
+            futures = [
+                batch.token.get_participant_properties(
+                    survey_id=self.survey_id, token_id=token["tid"])
+                for token in self.added_tokens]
+        for future, participant in zip(futures, self.participants):
+            self.assertEqual(participant["email"], future.result()["email"])
+
+    def test_get_participant_properties_batch_failure(self):
+        """A failing call in a batch should only fail its own future."""
+        with self.api.batch() as batch:
+            good = batch.token.get_participant_properties(
+                survey_id=self.survey_id, token_id=self.token_ids[0])
+            bad = batch.token.get_participant_properties(
+                survey_id=self.survey_id, token_id=92929292)
+        self.assertIsNotNone(good.result())
+        with self.assertRaises(LimeSurveyError) as lse:
+            bad.result()
+        self.assertIn("Error: No results were found", lse.exception.message)
+
+    def test_mirror_participants_success(self):
+        """Lookups on a mirrored survey should match the server's results."""
+        token0 = self.added_tokens[0]
+        expected = self.api.token.get_participant_properties(
+            survey_id=self.survey_id, token_id=token0["tid"],
+            token_properties=["email", "token"])
+        mirror = self.api.token.mirror_participants(survey_id=self.survey_id)
+        try:
+            result = self.api.token.get_participant_properties(
+                survey_id=self.survey_id, token_id=token0["tid"],
+                token_properties=["email", "token"])
+            self.assertEqual(expected, result)
+            with self.assertRaises(LimeSurveyError) as lse:
+                self.api.token.get_participant_properties(
+                    survey_id=self.survey_id, token_id=92929292)
+            self.assertIn("Error: No results were found",
+                          lse.exception.message)
+        finally:
+            mirror.detach()
+
     def test_invite_participants_tokens_failure(self):
         """Sending invites for non-existent tokens should return an error."""
         token_ids = [92929292, 929292945, 2055031111]
@@ -293,6 +425,36 @@ class TestTokensWithExisting(TestBase):
                 survey_id=self.survey_id, conditions={"email": "not_an_email"})
         self.assertIn("No survey participants found.", lse.exception.message)
 
+    def test_iter_participants_success(self):
+        """Iterating over participants should page through all of them."""
+        pager = self.api.token.iter_participants(
+            survey_id=self.survey_id, page_size=1)
+        result_token_ids = [x["tid"] for x in pager]
+        for token_id in self.token_ids:
+            self.assertIn(token_id, result_token_ids)
+        self.assertEqual(len(result_token_ids) + 1, pager.pages)
+        self.assertEqual(pager.pages, len(pager.page_times))
+
+    def test_iter_participants_prefetch_success(self):
+        """Prefetching pages should yield the same participants in order."""
+        expected = self.api.token.list_participants(survey_id=self.survey_id)
+        result = list(self.api.token.iter_participants(
+            survey_id=self.survey_id, page_size=2, prefetch=True))
+        self.assertEqual(expected, result)
+
+    def test_iter_participants_conditions_empty(self):
+        """A condition matching none should yield nothing, not an error."""
+        result = list(self.api.token.iter_participants(
+            survey_id=self.survey_id, conditions={"email": "not_an_email"}))
+        self.assertEqual([], result)
+
+    def test_fetch_all_participants_success(self):
+        """Fetching pages concurrently should return each participant once."""
+        expected = self.api.token.list_participants(survey_id=self.survey_id)
+        result = self.api.token.fetch_all_participants(
+            survey_id=self.survey_id, workers=2, page_size=1)
+        self.assertEqual(expected, result)
+
     def test_remind_participants_success(self):
         """ Should return array of result of each email send action and a
         count of invitations left to send in status key. """
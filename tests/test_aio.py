@@ -0,0 +1,41 @@
+import asyncio
+from tests.test_limesurvey import TestBase
+from limesurveyrc2api.aio import AsyncLimeSurvey
+from limesurveyrc2api.limesurvey import LimeSurveyError
+
+
+class TestAsyncLimeSurvey(TestBase):
+
+    def run_async(self, coroutine_function):
+        """Run the function with an open AsyncLimeSurvey, and return result."""
+        async def run():
+            async with AsyncLimeSurvey(
+                    url=self.url, username=self.username) as api:
+                await api.open(password=self.password)
+                return await coroutine_function(api)
+        return asyncio.run(run())
+
+    def test_open_close_success(self):
+        """Opening an async session should return a session key."""
+        async def open_close(api):
+            return api.session_key
+        self.assertEqual(32, len(self.run_async(open_close)))
+
+    def test_list_surveys_success(self):
+        """Async method calls should return the same results as sync ones."""
+        async def list_surveys(api):
+            return await api.survey.list_surveys()
+        result = self.run_async(list_surveys)
+        self.assertEqual(self.api.survey.list_surveys(), result)
+
+    def test_concurrent_calls_failure(self):
+        """An error in concurrent calls should be raised for that call."""
+        async def get_summaries(api):
+            return await asyncio.gather(
+                api.token.get_summary(survey_id=self.survey_id),
+                api.token.get_summary(survey_id=self.survey_id_invalid),
+                return_exceptions=True)
+        valid, invalid = self.run_async(get_summaries)
+        self.assertIn("token_count", valid)
+        self.assertIsInstance(invalid, LimeSurveyError)
+        self.assertIn("Invalid surveyid", invalid.message)
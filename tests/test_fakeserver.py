@@ -0,0 +1,393 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from base64 import b64decode
+from limesurveyrc2api.aio import AsyncLimeSurvey
+from limesurveyrc2api.cache import MISSING, DiskCache, MemoryCache
+from limesurveyrc2api.codec import CODECS, JsonCodec, get_codec
+from limesurveyrc2api.fakeserver import FakeLimeSurvey
+from limesurveyrc2api.hooks import Hook, SlowCallLog
+from limesurveyrc2api.incremental import ExportState
+from limesurveyrc2api.limesurvey import LimeSurvey, LimeSurveyError
+from limesurveyrc2api.retry import RetryPolicy
+from limesurveyrc2api.throttle import AdaptiveConcurrency, Throttle
+from limesurveyrc2api._stream import iter_result_items
+
+
+class TestFakeLimeSurvey(unittest.TestCase):
+    """The client against the fake server, which needs no LimeSurvey."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeLimeSurvey().start()
+        cls.survey_id = cls.server.add_survey(participants=5, responses=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.api = LimeSurvey(url=self.server.url,
+                              username=self.server.username)
+        self.api.open(password=self.server.password)
+
+    def tearDown(self):
+        self.api.close()
+
+    def test_get_session_key_failure(self):
+        """Opening a session with invalid creds should raise an error."""
+        api = LimeSurvey(url=self.server.url, username=self.server.username)
+        with self.assertRaises(LimeSurveyError) as ctx:
+            api.open(password="bad")
+        self.assertIn('Invalid user name or password', ctx.exception.message)
+
+    def test_list_questions_success(self):
+        """Listing questions should return the survey's questions."""
+        result = self.api.survey.list_questions(self.survey_id)
+        self.assertEqual(10, len(result))
+        for question in result:
+            self.assertEqual(str(self.survey_id), question["sid"])
+
+    def test_statuses_and_types_match_real_api(self):
+        """The fake should answer with the real API's statuses and types."""
+        for group in self.api.survey.list_groups(self.survey_id):
+            self.assertEqual(str(self.survey_id), group["sid"])
+        with self.assertRaises(LimeSurveyError) as ctx:
+            self.api.token.get_participant_properties(
+                self.survey_id, token_id=92929292)
+        self.assertIn("Error: No results were found", ctx.exception.message)
+
+        api = LimeSurvey(url=self.server.url, username=self.server.username)
+        api.session_key = "boguskey"
+        self.assertEqual("OK", api.close())
+
+    def test_write_invalidates_cached_survey(self):
+        """A write to a survey should drop only that survey's cache."""
+        survey_id = self.server.add_survey(participants=1)
+        cache = MemoryCache(ttl=60)
+        api = LimeSurvey(url=self.server.url, username=self.server.username,
+                         cache=cache)
+        with api:
+            api.open(password=self.server.password)
+            api.survey.list_surveys()
+            for x in (survey_id, self.survey_id):
+                api.survey.list_groups(x)
+            api.token.add_participants(
+                survey_id, [{"email": "new@example.com"}])
+            api.survey.list_surveys()
+            for x in (survey_id, self.survey_id):
+                api.survey.list_groups(x)
+            self.assertEqual((4, 2), (cache.misses, cache.hits))
+            api.survey.activate_tokens(survey_id)
+            api.survey.list_groups(survey_id)
+        self.assertEqual((5, 2), (cache.misses, cache.hits))
+
+    def test_cache_kept_apart_by_server_and_user(self):
+        """Clients sharing a cache file should not see each other's."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = DiskCache(os.path.join(temp_dir, "cache.db"))
+            params = {"iSurveyID": "admin"}
+            cache.set("list_surveys", params, [1], ["http://a/", "admin"])
+            self.assertIs(MISSING, cache.get(
+                "list_surveys", params, ["http://b/", "admin"]))
+            self.assertEqual([1], cache.get(
+                "list_surveys", params, ["http://a/", "admin"]))
+            cache.connection.close()
+
+    def test_batch_uses_cache_and_mirror(self):
+        """Batched calls should read and update the cache and mirrors."""
+        survey_id = self.server.add_survey(participants=2)
+        cache = MemoryCache(ttl=60)
+        api = LimeSurvey(url=self.server.url, username=self.server.username,
+                         cache=cache)
+        with api:
+            api.open(password=self.server.password)
+            api.survey.list_surveys()
+            api.token.mirror_participants(survey_id)
+            with api.batch() as batch:
+                surveys = batch.survey.list_surveys()
+                batch.token.delete_participants(survey_id, [1])
+                batch.survey.delete_survey(survey_id)
+            self.assertIn(str(survey_id), [x["sid"] for x in surveys.result()])
+            self.assertEqual((1, 1), (cache.misses, cache.hits))
+            result = api.survey.list_surveys()
+            self.assertNotIn(str(survey_id), [x["sid"] for x in result])
+            with self.assertRaises(LimeSurveyError):
+                api.token.get_participant_properties(survey_id, 1)
+
+    def test_mirror_copies_and_follows_writes(self):
+        """Mirror lookups should be copies, and rebuilt after writes."""
+        survey_id = self.server.add_survey(participants=2)
+        mirror = self.api.token.mirror_participants(survey_id)
+        try:
+            first = self.api.token.get_participant_properties(survey_id, 1)
+            first["firstname"] = "MUTATED"
+            second = self.api.token.get_participant_properties(survey_id, 1)
+            self.assertEqual("First0", second["firstname"])
+            self.assertEqual("N", second["sent"])
+            self.api.token.invite_participants(survey_id, [1])
+            third = self.api.token.get_participant_properties(survey_id, 1)
+            self.assertNotEqual("N", third["sent"])
+        finally:
+            mirror.detach()
+
+    def test_bulk_add_sized_by_request_sent(self):
+        """Bulk adds should shrink chunks whose request is over max_bytes."""
+        survey_id = self.server.add_survey(participants=1)
+        rows = [{"email": "bulk%d@example.com" % x} for x in range(40)]
+        result = self.api.token.add_participants_bulk(
+            survey_id, rows, chunk_size=20, min_chunk_size=5, max_bytes=500)
+        self.assertEqual(40, len([x for x in result.participants if x]))
+        self.assertEqual([20, 10, 10], result.chunk_sizes)
+
+    def test_list_participants_paged(self):
+        """Paging through participants should return all of them once."""
+        result = list(self.api.token.iter_participants(
+            self.survey_id, page_size=2))
+        self.assertEqual(5, len(set(x["tid"] for x in result)))
+
+    def test_export_responses_csv(self):
+        """A csv export should have a header and a line per response."""
+        result = b64decode(self.api.survey.export_responses(
+            self.survey_id, document_type="csv")).decode("utf-8-sig")
+        self.assertEqual(4, len(result.splitlines()))
+
+    def test_expired_session_renewed(self):
+        """A call after the sessions expire should open a new session."""
+        self.server.expire_sessions()
+        result = self.api.token.get_summary(self.survey_id, "token_count")
+        self.assertEqual({"token_count": "5"}, result)
+
+    def test_expired_session_renewed_for_batch_and_stream(self):
+        """Batches and streamed calls should renew an expired session."""
+        self.server.expire_sessions()
+        with self.api.batch() as batch:
+            groups = batch.survey.list_groups(self.survey_id)
+            summary = batch.token.get_summary(self.survey_id, "token_count")
+        self.assertEqual(2, len(groups.result()))
+        self.assertEqual({"token_count": "5"}, summary.result())
+
+        self.server.expire_sessions()
+        result = list(self.api.token.stream_participants(self.survey_id))
+        self.assertEqual(5, len(result))
+
+    def test_stream_items_split_across_chunks(self):
+        """Items should parse the same when every byte is its own chunk."""
+        expected = [4.5, 123, -1.5e-3, "a, b]", {"x": [1, 2]}, True, None]
+        body = ('{"id": 1, "result": [4.5, 123, -1.5e-3, "a, b]", '
+                '{"x": [1, 2]}, true, null], "error": null}').encode("utf-8")
+        items, result = iter_result_items(
+            "list_participants", (body[i:i + 1] for i in range(len(body))))
+        self.assertIsNone(result)
+        self.assertEqual(expected, list(items))
+
+    def test_stream_holds_throttle_slot(self):
+        """A streamed call should hold its slot until the stream is read."""
+        survey_id = self.server.add_survey(participants=4)
+        concurrency = AdaptiveConcurrency(initial=4)
+        api = LimeSurvey(url=self.server.url, username=self.server.username,
+                         throttle=Throttle(concurrency=concurrency))
+        with api:
+            api.open(password=self.server.password)
+            items = api.token.stream_participants(survey_id)
+            next(items)
+            self.assertEqual(1, concurrency.in_flight)
+            self.assertEqual(4, 1 + len(list(items)))
+            self.assertEqual(0, concurrency.in_flight)
+
+    def test_sync_helpers_only_on_blocking_client(self):
+        """Helpers needing the blocking client should not be on the others."""
+        api = AsyncLimeSurvey(url=self.server.url,
+                              username=self.server.username)
+        with self.api.batch() as batch:
+            for client in (api, batch):
+                self.assertFalse(hasattr(client.token, "iter_participants"))
+                self.assertFalse(hasattr(client.survey, "stream_questions"))
+                self.assertTrue(hasattr(client.token, "list_participants"))
+        self.assertTrue(hasattr(self.api.token, "iter_participants"))
+
+    def test_async_read_timeout(self):
+        """The async client should give up on a server that stops."""
+        async def run():
+            async with AsyncLimeSurvey(
+                    url=self.server.url, username=self.server.username,
+                    timeout=(10, 0.2)) as api:
+                await api.open(password=self.server.password)
+
+        self.server.latency = 1.0
+        try:
+            started = time.monotonic()
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(run())
+            self.assertLess(time.monotonic() - started, 0.9)
+        finally:
+            self.server.latency = 0.0
+
+    def test_concurrent_read_calls_coalesced(self):
+        """Identical concurrent reads should be sent once, and shared."""
+        api = LimeSurvey(url=self.server.url, username=self.server.username,
+                         coalesce=True)
+        api.open(password=self.server.password)
+        start = threading.Barrier(8)
+
+        def list_questions(_):
+            start.wait()
+            return api.survey.list_questions(self.survey_id)
+
+        calls = self.server.calls.get("list_questions", 0)
+        self.server.latency = 0.2  # Keeps the first call in flight.
+        try:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(list_questions, range(8)))
+        finally:
+            self.server.latency = 0.0
+            api.close()
+        for result in results:
+            self.assertEqual(results[0], result)
+        sent = self.server.calls["list_questions"] - calls
+        self.assertEqual(8, sent + api.single_flight.coalesced)
+        self.assertLess(sent, 8)
+
+    def test_injected_errors_retried(self):
+        """Injected http errors should be raised, or retried if allowed."""
+        self.server.fail_next(status=502)
+        with self.assertRaises(LimeSurveyError) as ctx:
+            self.api.survey.list_groups(self.survey_id)
+        self.assertIn("502", ctx.exception.message)
+
+        self.api.retry = RetryPolicy(backoff=0.01)
+        self.server.fail_next(status=502, count=2)
+        self.assertEqual(2, len(self.api.survey.list_groups(self.survey_id)))
+
+    def test_deadline_cuts_slow_attempt(self):
+        """An attempt with no response should fail at the deadline."""
+        self.api.retry = RetryPolicy(deadline=0.3)
+        self.server.latency = 2.0
+        started = time.monotonic()
+        try:
+            with self.assertRaises(requests.Timeout):
+                self.api.survey.list_groups(self.survey_id)
+        finally:
+            self.server.latency = 0.0
+        self.assertLess(time.monotonic() - started, 1.0)
+
+    def test_metrics_count_calls_and_errors(self):
+        """Metrics should count calls, errors and retries per method."""
+        self.api.retry = RetryPolicy(backoff=0.01)
+        self.server.fail_next(status=503)
+        self.api.survey.list_groups(self.survey_id)
+        with self.assertRaises(LimeSurveyError):
+            self.api.survey.list_groups(-1)
+        metrics = self.api.metrics()["list_groups"]
+        self.assertEqual(2, metrics["calls"])
+        self.assertEqual(1, metrics["retries"])
+        self.assertEqual({"Error: Invalid survey ID": 1}, metrics["errors"])
+        self.assertEqual(2, metrics["latency_histogram"][-1][1])
+        text = self.api.metrics_text()
+        self.assertIn(
+            'limesurvey_rpc_calls_total{method="list_groups"} 2', text)
+
+    def test_hooks_get_phase_timings(self):
+        """Hooks should be called with the timings of each phase."""
+        events = []
+
+        class Recorder(Hook):
+            def after_call(self, trace, result):
+                events.append((trace.method, list(trace.timings)))
+
+            def on_error(self, trace, error):
+                events.append((trace.method, trace.phase))
+
+        self.api.hooks.append(Recorder())
+        self.api.survey.list_groups(self.survey_id)
+        with self.assertRaises(LimeSurveyError):
+            self.api.survey.list_groups(-1)
+        self.assertEqual([
+            ("list_groups", ["serialize", "network", "parse", "check"]),
+            ("list_groups", "check")], events)
+
+    def test_slow_call_logged(self):
+        """Calls slower than the threshold should be logged."""
+        self.api.hooks.append(SlowCallLog(threshold=0))
+        with self.assertLogs("limesurveyrc2api", "WARNING") as logs:
+            self.api.survey.list_groups(self.survey_id)
+        self.assertIn("Slow call to list_groups", logs.output[0])
+
+    def test_codecs_give_same_results(self):
+        """The stdlib codec and the default codec should agree."""
+        api = LimeSurvey(url=self.server.url, username=self.server.username,
+                         codec=JsonCodec())
+        api.open(password=self.server.password)
+        try:
+            expected = api.token.list_participants(self.survey_id)
+        finally:
+            api.close()
+        self.assertEqual(
+            expected, self.api.token.list_participants(self.survey_id))
+        self.assertIs(type(get_codec().dumps({})), bytes)
+
+    def test_stream_matches_list(self):
+        """Streamed participants and questions should match the lists."""
+        self.assertEqual(
+            self.api.token.list_participants(self.survey_id),
+            list(self.api.token.stream_participants(
+                self.survey_id, chunk_size=16)))
+        self.assertEqual(
+            self.api.survey.list_questions(self.survey_id),
+            list(self.api.survey.stream_questions(self.survey_id)))
+        with self.assertRaises(LimeSurveyError) as ctx:
+            list(self.api.survey.stream_questions(-1))
+        self.assertIn("Error: Invalid survey ID", ctx.exception.message)
+
+    def test_byte_order_mark_ignored(self):
+        """Responses starting with a UTF-8 BOM should be decoded."""
+        self.server.bom = True
+        try:
+            for codec, module in CODECS:
+                if module is None:
+                    continue
+                self.api.codec = codec()
+                self.assertEqual(
+                    2, len(self.api.survey.list_groups(self.survey_id)))
+            self.assertEqual(5, len(list(
+                self.api.token.stream_participants(self.survey_id))))
+            with self.api.batch() as batch:
+                groups = batch.survey.list_groups(self.survey_id)
+            self.assertEqual(2, len(groups.result()))
+        finally:
+            self.server.bom = False
+
+    def test_export_responses_frame_kinds_agree(self):
+        """Frames parsed with pandas or pyarrow should match the fallback."""
+        expected = self.api.survey.export_responses_frame(
+            self.survey_id, kind="python")
+        self.assertEqual([1, 2, 3], expected["id"])
+        for kind in ("pandas", "arrow", "numpy"):
+            try:
+                result = self.api.survey.export_responses_frame(
+                    self.survey_id, kind=kind)
+            except ImportError:
+                continue
+            if kind == "arrow":
+                result = result.to_pydict()
+            for name, values in expected.items():
+                self.assertEqual(values, list(result[name]), name)
+
+    def test_export_responses_incremental_full_headings(self):
+        """Incremental exports should find the ids with any heading type."""
+        survey_id = self.server.add_survey(responses=2)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            state = ExportState(os.path.join(temp_dir, "state.json"))
+            first = self.api.survey.export_responses_incremental(
+                survey_id, state, heading_type="full")
+            self.server.add_responses(survey_id, 1)
+            second = self.api.survey.export_responses_incremental(
+                survey_id, state, heading_type="abbreviated")
+        self.assertEqual(["1", "2"], [x["Response ID"] for x in first])
+        self.assertEqual(["3"], [x["Response ID"] for x in second])
+        self.assertEqual(3, state.get(survey_id))
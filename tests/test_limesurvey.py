@@ -1,6 +1,13 @@
 import os
+import time
 import unittest
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from limesurveyrc2api.limesurvey import LimeSurvey, LimeSurveyError
+from limesurveyrc2api.breaker import CircuitBreaker
+from limesurveyrc2api.exceptions import CircuitOpenError
+from limesurveyrc2api.retry import RetryPolicy
+from limesurveyrc2api.throttle import AdaptiveConcurrency, Throttle
 from configparser import ConfigParser
 from operator import itemgetter
 
@@ -77,3 +84,122 @@ class TestSessions(TestBase):
         self.assertEqual("OK", result)
 
         self.api.session_key = real_key
+
+    def test_context_manager_releases_session(self):
+        """Leaving the context manager should release the session and pool."""
+        with LimeSurvey(url=self.url, username=self.username) as api:
+            api.open(password=self.password)
+            self.assertEqual(32, len(api.session_key))
+        self.assertIsNone(api.session_key)
+        self.assertIsNone(api.http)
+
+    def test_expired_session_renewed(self):
+        """A call with an expired session key should open a new session."""
+        self.api.session_key = "boguskey"
+        result = self.api.survey.list_questions(self.survey_id)
+        self.assertIsInstance(result, list)
+        self.assertEqual(32, len(self.api.session_key))
+
+
+class TestSessionPool(TestBase):
+
+    def test_session_pool_opens_and_releases_sessions(self):
+        """Pooled sessions should have their own keys and be released."""
+        with self.api.session_pool(self.password, size=2) as pool:
+            keys = set(x.session_key for x in pool.clients)
+            self.assertEqual(2, len(keys))
+            self.assertNotIn(self.api.session_key, keys)
+            with pool.session() as client:
+                result = client.survey.list_questions(self.survey_id)
+            self.assertIsInstance(result, list)
+        self.assertEqual([], pool.clients)
+
+
+class TestRetry(TestBase):
+
+    def test_unreachable_server_fails_within_deadline(self):
+        """Retries to a server that never answers should stop at deadline."""
+        retry = RetryPolicy(attempts=10, backoff=0.01, deadline=0.5)
+        api = LimeSurvey(url="http://10.255.255.1/", username=self.username,
+                         timeout=(0.1, 0.1), retry=retry)
+        api.session_key = "boguskey"
+        started = time.monotonic()
+        with self.assertRaises(requests.RequestException):
+            api.survey.list_questions(self.survey_id)
+        self.assertLess(time.monotonic() - started, 1.0)
+
+    def test_calls_succeed_with_retry_policy(self):
+        """Calls should succeed as usual through a retry policy."""
+        api = LimeSurvey(url=self.url, username=self.username,
+                         retry=RetryPolicy())
+        api.open(password=self.password)
+        try:
+            result = api.survey.list_questions(self.survey_id)
+        finally:
+            api.close()
+        self.assertIsInstance(result, list)
+
+
+class TestCircuitBreaker(TestBase):
+
+    def test_breaker_opens_for_unreachable_server(self):
+        """After repeated failures, calls should fail fast, without sending."""
+        breaker = CircuitBreaker(minimum_calls=2, reset_timeout=60)
+        api = LimeSurvey(url="http://10.255.255.1/", username=self.username,
+                         timeout=(0.1, 0.1), breaker=breaker)
+        api.session_key = "boguskey"
+        for _ in range(2):
+            with self.assertRaises(requests.RequestException):
+                api.survey.list_questions(self.survey_id)
+        self.assertEqual("open", breaker.state)
+        with self.assertRaises(CircuitOpenError):
+            api.survey.list_questions(self.survey_id)
+
+    def test_breaker_counts_only_half_open_probes(self):
+        """A request sent while closed should not count as a probe."""
+        breaker = CircuitBreaker(minimum_calls=1, reset_timeout=0)
+        sent_while_closed = breaker.before("list_questions")
+        failed = breaker.before("list_questions")
+        breaker.record(requests.ConnectionError(), failed)
+        probe = breaker.before("list_questions")
+        self.assertIsNotNone(probe)
+        breaker.record(probe=sent_while_closed)
+        self.assertEqual("half_open", breaker.state)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before("list_questions")
+        breaker.record(probe=probe)
+        self.assertEqual("closed", breaker.state)
+
+    def test_breaker_stays_closed_for_working_server(self):
+        """Calls to a working server should leave the breaker closed."""
+        breaker = CircuitBreaker(minimum_calls=1)
+        api = LimeSurvey(url=self.url, username=self.username,
+                         breaker=breaker)
+        api.open(password=self.password)
+        try:
+            api.survey.list_questions(self.survey_id)
+        finally:
+            api.close()
+        self.assertEqual("closed", breaker.health()["state"])
+
+
+class TestThrottle(TestBase):
+
+    def test_throttled_calls_keep_to_rate(self):
+        """Throttled calls should succeed, no faster than the rate."""
+        concurrency = AdaptiveConcurrency(initial=1, maximum=4)
+        throttle = Throttle(rate=20, burst=1, concurrency=concurrency)
+        api = LimeSurvey(url=self.url, username=self.username,
+                         throttle={"default": throttle})
+        api.open(password=self.password)
+        started = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(
+                    lambda _: api.survey.list_questions(self.survey_id),
+                    range(10)))
+        finally:
+            api.close()
+        self.assertGreaterEqual(time.monotonic() - started, 0.45)
+        self.assertEqual(10, len(results))
+        self.assertEqual(0, concurrency.in_flight)